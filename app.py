@@ -1,14 +1,50 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from firebase_admin import initialize_app, credentials, firestore, auth, _apps
 from typing import List, Optional
 from recommender import TopicBasedRecommender
 from feed_manager import FeedManager
+from metrics import REGISTRY, span
+from serialization import encode_recommendations, fragment_cache, json_response
+from pagination import InvalidCursor, MalformedCursor, SnapshotStore
+from feedback import FeedbackStore
 import os
+import secrets
 import base64
 import json
+import logging
+import logging.handlers
+import queue
+import atexit
+import asyncio
+import time
 from firebase_admin import credentials, initialize_app, _apps
 
+
+def configure_logging():
+    # LOG_LEVEL accepts the standard level names, or OFF to silence the app loggers entirely.
+    # Records are handed to a background thread so the request path never blocks on stdout.
+    level_name = os.environ.get("LOG_LEVEL", "INFO").upper()
+    root = logging.getLogger()
+    if level_name == "OFF":
+        logging.disable(logging.CRITICAL)
+        return
+    root.setLevel(getattr(logging, level_name, logging.INFO))
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 origins = [
@@ -40,29 +76,46 @@ if not _apps:
 
 db = firestore.client()
 
-recommender = TopicBasedRecommender()
 feed_manager = FeedManager()
+recommender = TopicBasedRecommender(feed_manager=feed_manager)
+# Encoded articles are released together with the feeds they came from
+recommender.feed_parser.evict_listeners.append(fragment_cache.discard)
+# Ranked candidates behind each user's first page; in-process, so multi-worker deployments need sticky sessions
+snapshots = SnapshotStore()
+feedback_store = FeedbackStore(db)
+
+# Set once the background warm-up started at boot has finished
+readiness = {"ready": False, "started_at": time.monotonic(), "warm_up_seconds": None}
+
+def user_fields(user_dict: dict) -> dict:
+    # Shared with batch warming, so warmed entries are keyed exactly like the user's live requests
+    return {
+        "interests": user_dict.get("interests", []),
+        "nationality": user_dict.get("nationality", "US"),  # Default to US if not provided
+        "term_weights": user_dict.get("term_weights") or {}
+    }
+
+def load_user(uid: str) -> Optional[dict]:
+    user_data = db.collection('users').document(uid).get()
+    return user_data.to_dict() if user_data.exists else None
 
 async def get_current_user(authorization: str = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
     try:
-        token = authorization.replace('Bearer ', '')
-        decoded_token = auth.verify_id_token(token)
-        uid = decoded_token['uid']
-
-        # Fetch user interests from Firestore
-        user_ref = db.collection('users').document(uid)
-        user_data = user_ref.get()
+        with span("auth"):
+            token = authorization.replace('Bearer ', '')
+            decoded_token = auth.verify_id_token(token)
+            uid = decoded_token['uid']
 
-        if not user_data.exists:
-            raise HTTPException(status_code=404, detail="User not found")
+            # Fetch user interests from Firestore
+            user_ref = db.collection('users').document(uid)
+            user_data = user_ref.get()
 
-        user_dict = user_data.to_dict()
-        interests = user_dict.get("interests", [])
-        nationality = user_dict.get("nationality", "US")  # Default to US if not provided
+            if not user_data.exists:
+                raise HTTPException(status_code=404, detail="User not found")
 
-        return {"uid": uid, "interests": interests, "nationality": nationality}
+            return {"uid": uid, **user_fields(user_data.to_dict())}
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid authentication: {str(e)}")
     
@@ -71,53 +124,174 @@ async def get_current_user(authorization: str = Header(None)):
 async def get_recommendations(
     user_profile: str = "General interest reader",
     feed_urls: Optional[List[str]] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(12, ge=1, le=50),
+    accept_encoding: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
+    user_fields = {
+        "user_id": current_user['uid'],
+        "interests": current_user['interests'],
+        "nationality": current_user['nationality']
+    }
+
+    if cursor:
+        # "Load more" pages come straight from the snapshot taken with the first page
+        try:
+            page, next_cursor = snapshots.page(current_user['uid'], cursor, page_size)
+        except MalformedCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=410, detail=f"{e}, reload recommendations")
+        with span("serialize"):
+            body = encode_recommendations(page, {**user_fields, "next_cursor": next_cursor})
+            return json_response(body, accept_encoding)
+
     if not feed_urls:
-        feed_urls = feed_manager.get_feeds_for_user(
-            current_user['interests'],
-            current_user['nationality']
-        )
+        with span("feed_selection"):
+            feed_urls = feed_manager.get_feeds_for_user(
+                current_user['interests'],
+                current_user['nationality']
+            )
+
+    term_vector = feedback_store.get(current_user['uid'], current_user.get('term_weights'))
 
     try:
         recommendations = await recommender.get_recommendations(
             user_profile,
             feed_urls,
             current_user['interests'],
-            current_user['nationality']
+            current_user['nationality'],
+            term_vector=term_vector
+        )
+        candidates = recommender.get_candidates(
+            feed_urls, current_user['interests'], current_user['nationality'], term_vector
         )
-        
-        # Flatten the recommendations to match frontend expectations
-        combined_recommendations = []
-        
-        # Add country recommendations
-        combined_recommendations.extend(recommendations["country_recommendations"])
-        
-        # Add interest recommendations (flattening the 2D array)
-        for interest_group in recommendations["interest_recommendations"]:
-            combined_recommendations.extend(interest_group)
-        
-        # Add debugging to see what we're sending
-        print(f"[DEBUG] Sending {len(combined_recommendations)} total recommendations")
-        if combined_recommendations:
-            print(f"[DEBUG] Sample recommendation structure: {combined_recommendations[0].keys()}")
-        
-        return {
-            "recommendations": combined_recommendations,  # Frontend expects this key
-            "user_id": current_user['uid'],
-            "interests": current_user['interests'],
-            "nationality": current_user['nationality']
-        }
+
+        with span("serialize"):
+            # Flatten the recommendations to match frontend expectations
+            combined_recommendations = list(recommendations["country_recommendations"])
+            for interest_group in recommendations["interest_recommendations"]:
+                combined_recommendations.extend(interest_group)
+
+            # The first page holds page_size articles too: the country and interest groups in
+            # order, trimmed or topped up from the ranked candidates, the rest left for later pages
+            ranked = combined_recommendations + candidates
+            combined_recommendations = ranked[:page_size]
+            next_cursor = snapshots.create(current_user['uid'], ranked[page_size:])
+
+            logger.debug("Sending %d total recommendations", len(combined_recommendations))
+
+            # Articles are encoded once and reused across responses; only the per-user fields are new work
+            body = encode_recommendations(combined_recommendations, {**user_fields, "next_cursor": next_cursor})
+            return json_response(body, accept_encoding)
     except Exception as e:
-        import traceback
-        print(f"[ERROR] {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Recommendation request failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+class ClickFeedback(BaseModel):
+    link: str
+    title: str
+    description: str = ""
+
+@app.post("/api/feedback")
+async def record_feedback(click: ClickFeedback, current_user: dict = Depends(get_current_user)):
+    # Memory only; the vector reaches Firestore with the next batched flush
+    vector = feedback_store.record_click(
+        current_user['uid'],
+        recommender.tokenize(f"{click.title} {click.description}"),
+        current_user.get('term_weights')
+    )
+    return {"status": "ok", "terms": len(vector)}
+
+class BatchProfile(BaseModel):
+    interests: List[str] = []
+    nationality: str = "US"
+    # Warm this user's own entry: interests, nationality and click vector come from their document
+    uid: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    profiles: List[BatchProfile]
+
+def verify_batch_token(x_batch_token: str = Header(None)):
+    # Batch runs are an operator tool for off-peak cache warming, disabled unless a token is configured
+    expected = os.environ.get("BATCH_API_TOKEN")
+    if not expected or not x_batch_token or not secrets.compare_digest(x_batch_token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Batch API is not enabled for this caller")
+
+@app.post("/api/recommendations/batch", dependencies=[Depends(verify_batch_token)])
+async def batch_recommendations(request: BatchRequest, include_results: bool = False):
+    # Profiles without a uid only match live requests from users who have never clicked,
+    # since everyone else's results are keyed by their click vector
+    users = await asyncio.gather(*(
+        asyncio.to_thread(load_user, profile.uid) for profile in request.profiles if profile.uid
+    ))
+    users = iter(users)
+    profiles = []
+    missing_users = 0
+    for profile in request.profiles:
+        if not profile.uid:
+            profiles.append({"interests": profile.interests, "nationality": profile.nationality})
+            continue
+        user_dict = next(users)
+        if user_dict is None:
+            missing_users += 1
+            continue
+        fields = user_fields(user_dict)
+        profiles.append({
+            "interests": fields["interests"],
+            "nationality": fields["nationality"],
+            # Seeds the in-memory vector the user's next request will use, so the keys match
+            "term_vector": feedback_store.get(profile.uid, fields["term_weights"]),
+        })
+
+    results, stored = await recommender.warm_result_cache(profiles)
+    response = {
+        "profiles": len(request.profiles),
+        "stored": stored,
+        "generic": sum(1 for profile in profiles if profile.get("term_vector") is None),
+        "missing_users": missing_users,
+    }
+    if include_results:
+        response["results"] = results
+    return response
+
+async def warm_up():
+    try:
+        await asyncio.to_thread(recommender.warm_up)
+    except Exception as e:
+        logger.exception("Warm-up failed, serving cold: %s", e)
+    readiness["warm_up_seconds"] = round(time.monotonic() - readiness["started_at"], 3)
+    readiness["ready"] = True
+
+@app.on_event("startup")
+async def startup_event():
+    # Warm up in the background so the port opens immediately; /ready reports when it is done
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+    app.state.feedback_task = asyncio.create_task(feedback_store.run())
+
 @app.on_event("shutdown")
 async def shutdown_event():
+    app.state.feedback_task.cancel()
+    await feedback_store.flush()
     await recommender.close()
 
+@app.get("/api/feeds/health")
+async def feed_health(limit: int = 20):
+    return {"feeds": recommender.feed_parser.health.report(limit)}
+
+@app.get("/ready")
+async def ready():
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(
+        {"ready": readiness["ready"], "warm_up_seconds": readiness["warm_up_seconds"]},
+        status_code=status_code
+    )
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"status": "ok"}
\ No newline at end of file
@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from recommender import TopicBasedRecommender
+
+
+def load_profiles(path):
+    """Read profiles from a JSON list or a JSON-lines file of {"interests": [...], "nationality": "..."} objects."""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+async def run_batch(profiles, output_path, processes=0):
+    recommender = TopicBasedRecommender(scorer_processes=processes)
+    try:
+        start = time.perf_counter()
+        results = await recommender.get_batch_recommendations(profiles)
+        elapsed = time.perf_counter() - start
+    finally:
+        await recommender.close()
+
+    print(f"Computed recommendations for {len(results)} profiles in {elapsed:.2f}s", file=sys.stderr)
+
+    output = [
+        {"id": profile.get("id"), "interests": profile.get("interests", []),
+         "nationality": profile.get("nationality", "US"), **result}
+        for profile, result in zip(profiles, results)
+    ]
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(output, f, default=str)
+        print(f"Results written to {output_path}", file=sys.stderr)
+    else:
+        json.dump(output, sys.stdout, default=str)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute recommendations for many profiles against one shared corpus")
+    parser.add_argument("profiles", help="JSON or JSON-lines file of profiles")
+    parser.add_argument("-o", "--output", help="write results here instead of stdout")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="rank profiles in this many worker processes (0 ranks in-process)")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING))
+    asyncio.run(run_batch(load_profiles(args.profiles), args.output, args.processes))
@@ -0,0 +1,69 @@
+"""Measure cold-start cost in fresh interpreters.
+
+Each run starts a new Python process and times importing the recommender stack,
+constructing TopicBasedRecommender and running its warm-up. When FIREBASE_CREDENTIALS
+is set, importing the full FastAPI app is timed as well. Prints one JSON document.
+
+    python benchmarks/cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import recommender
+imported = time.perf_counter()
+r = recommender.TopicBasedRecommender()
+constructed = time.perf_counter()
+r.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "construct_seconds": constructed - imported,
+    "warm_up_seconds": warmed - constructed,
+}))
+"""
+
+APP_PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+print(json.dumps({"app_import_seconds": time.perf_counter() - start}))
+"""
+
+
+def run_probe(code):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def summarize(samples):
+    return {
+        key: {"min": min(values), "median": statistics.median(values), "max": max(values)}
+        for key, values in ((key, [sample[key] for sample in samples]) for key in samples[0])
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    report = {"runs": args.runs, "python": sys.version.split()[0]}
+    report["recommender"] = summarize([run_probe(PROBE) for _ in range(args.runs)])
+    if os.environ.get("FIREBASE_CREDENTIALS"):
+        report["app"] = summarize([run_probe(APP_PROBE) for _ in range(args.runs)])
+    print(json.dumps(report, indent=2))
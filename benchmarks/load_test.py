@@ -0,0 +1,429 @@
+"""Load-test the /api/recommendations pipeline against recorded feeds.
+
+Feed and image downloads are answered by a local HTTP stub that replays responses
+recorded with the "record" command. URLs with no recording get a deterministic
+synthetic RSS feed or a placeholder JPEG, so the harness also runs offline. No
+recording is committed: unless you record one, every feed and image is synthetic, and
+the report's "mode" says so. Auth is stubbed through FastAPI's dependency overrides;
+everything else (feed selection, fetching over aiohttp, parsing, thumbnails, scoring,
+ranking, serialization) is the real request path. Prints one JSON document.
+
+    python benchmarks/load_test.py record [--images]       # needs network, writes benchmarks/fixtures/
+    python benchmarks/load_test.py run --iterations 10 -o bench.json
+
+Each scenario (1, 3 and all interests) is measured cold (caches and feed health
+cleared before every request) and warm (caches primed, concurrent clients). A cold
+request in which a feed fails that was not recorded as failing aborts the run, since
+its latency would no longer measure the full workload.
+Requires httpx in addition to the app's requirements.
+"""
+import argparse
+import asyncio
+import email.utils
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+from io import BytesIO
+from unittest import mock
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_FIXTURES = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+NATIONALITY = "US"
+SEED = 0
+
+
+def fixture_file(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def load_manifest(fixtures_dir: str) -> dict:
+    path = os.path.join(fixtures_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def synthetic_feed(url: str) -> bytes:
+    from recommender import TOPIC_KEYWORDS
+
+    rng = random.Random(url)
+    words = [kw for kws in TOPIC_KEYWORDS.values() for kw in kws]
+    filler = "the report said on tuesday that new plans were announced after months of work".split()
+    now = datetime.now()
+    items = []
+    for i in range(30):
+        title = " ".join(rng.choice(words + filler) for _ in range(8)).capitalize()
+        body = " ".join(rng.choice(words + filler * 3) for _ in range(60))
+        image = f"https://images.example/{fixture_file(url)[:8]}/{i}.jpg"
+        published = email.utils.format_datetime(now - timedelta(days=rng.uniform(0, 40)))
+        if i % 2:
+            media, description = f'<media:thumbnail url="{image}"/>', f'<p>{escape(body)}</p>'
+        else:
+            media, description = "", f'<p><img src="{image}"/>{escape(body)}</p>'
+        items.append(
+            f"<item><title>{escape(title)}</title><link>{escape(url)}#{i}</link>"
+            f"<description>{escape(description)}</description><pubDate>{published}</pubDate>"
+            f"<author>bench@example.com</author><category>{rng.choice(list(TOPIC_KEYWORDS))}</category>"
+            f"{media}</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+        f"<title>Synthetic {escape(url)}</title><link>{escape(url)}</link>"
+        + "".join(items) + "</channel></rss>"
+    ).encode("utf-8")
+
+
+def placeholder_jpeg() -> bytes:
+    from PIL import Image
+
+    image = Image.effect_noise((800, 600), 48).convert("RGB")
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def serve_fixtures(fixtures_dir: str, port_queue):
+    from aiohttp import web
+
+    manifest = load_manifest(fixtures_dir)
+    bodies = {}
+    for url, entry in manifest.items():
+        if entry["status"] == 200:
+            with open(os.path.join(fixtures_dir, "bodies", entry["file"]), "rb") as f:
+                bodies[url] = f.read()
+    synthetic = {}
+    image = placeholder_jpeg()
+    stats = Counter()
+
+    async def replay(request):
+        url, kind = request.query["url"], request.query.get("kind", "feed")
+        entry = manifest.get(url)
+        if entry is not None:
+            stats[f"{kind}_replayed"] += 1
+            if entry["status"] != 200:
+                return web.Response(status=entry["status"])
+            return web.Response(body=bodies[url], content_type="application/octet-stream")
+        stats[f"{kind}_synthesized"] += 1
+        if kind == "image":
+            return web.Response(body=image, content_type="image/jpeg")
+        if url not in synthetic:
+            synthetic[url] = synthetic_feed(url)
+        return web.Response(body=synthetic[url], content_type="application/rss+xml")
+
+    async def report(request):
+        return web.json_response(dict(stats))
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/replay", replay)
+        app.router.add_get("/stats", report)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def start_stub(fixtures_dir: str):
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    process = context.Process(target=serve_fixtures, args=(fixtures_dir, port_queue), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+
+def route_through_stub(http_client, stub_url: str):
+    """Send every download of an HttpClient to the stub, keeping the real aiohttp path.
+
+    Everything then shares one host, so each pool's per-host limit is raised to its total
+    limit; otherwise the stub host would queue far more than any real feed host does.
+    """
+    http_client.limits = {kind: (limit, limit) for kind, (limit, _) in http_client.limits.items()}
+    get_bytes = http_client.get_bytes
+
+    async def replayed(url, kind, max_bytes, timeout, headers=None, trace=None):
+        return await get_bytes(f"{stub_url}/replay?kind={kind}&url={quote(url, safe='')}",
+                               kind, max_bytes, timeout, headers, trace)
+
+    http_client.get_bytes = replayed
+
+
+def import_app():
+    import firebase_admin
+    from firebase_admin import firestore
+
+    # app.py initializes Firebase and opens a Firestore client at import. Neither is used
+    # once get_current_user is overridden, so both are stubbed for the import only.
+    with mock.patch.dict(firebase_admin._apps, {"[DEFAULT]": object()}), \
+            mock.patch.object(firestore, "client"):
+        import app
+    return app
+
+
+def scenarios(feed_manager) -> dict:
+    all_interests = list(feed_manager.interest_to_opml_files)
+    return {
+        "one_interest": ["Technology"],
+        "three_interests": ["Technology", "Science", "Business"],
+        "all_interests": all_interests,
+    }
+
+
+def percentiles(latencies) -> dict:
+    import numpy as np
+
+    ms = np.array(latencies) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def stage_totals() -> dict:
+    from metrics import STAGE_LATENCY
+
+    with STAGE_LATENCY._lock:
+        return {key[0]: (series[1], series[2]) for key, series in STAGE_LATENCY._series.items()}
+
+
+def stage_means(before: dict, after: dict) -> dict:
+    means = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            means[stage] = round((total - prev_total) / (count - prev_count) * 1000, 3)
+    return means
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Harness:
+    def __init__(self, app_module, client, recorded_failures=()):
+        self.app_module = app_module
+        self.client = client
+        self.recorded_failures = set(recorded_failures)
+
+    def login(self, interests):
+        user = {"uid": "bench-user", "interests": interests, "nationality": NATIONALITY}
+        self.app_module.app.dependency_overrides[self.app_module.get_current_user] = lambda: user
+
+    def reset_caches(self):
+        from serialization import fragment_cache
+
+        recommender = self.app_module.recommender
+        recommender.feed_parser.feed_cache.clear()
+        recommender.feed_parser._in_flight.clear()
+        # Circuits opened by an earlier request would shrink the workload of the next one
+        recommender.feed_parser.health.feeds.clear()
+        recommender.result_cache.clear()
+        recommender.warm_cache.clear()
+        recommender.corpus_cache.clear()
+        fragment_cache.clear()
+        random.seed(SEED)
+
+    async def request(self) -> float:
+        start = time.perf_counter()
+        response = await self.client.get("/api/recommendations")
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        return elapsed
+
+    def failed_feeds(self) -> list:
+        health = self.app_module.recommender.feed_parser.health
+        return sorted(url for url, feed in health.feeds.items() if feed.failures)
+
+    async def cold(self, iterations: int) -> dict:
+        before = stage_totals()
+        latencies = []
+        failed = []
+        for _ in range(iterations):
+            self.reset_caches()
+            latencies.append(await self.request())
+            failed = self.failed_feeds()
+            unexpected = [url for url in failed if url not in self.recorded_failures]
+            if unexpected:
+                raise RuntimeError(f"{len(unexpected)} feeds failed in a cold request, e.g. {unexpected[0]}; "
+                                   "the measurement would not cover the full workload")
+        return {**percentiles(latencies), "failed_feeds": len(failed),
+                "stages_mean_ms": stage_means(before, stage_totals())}
+
+    async def warm(self, iterations: int, concurrency: int) -> dict:
+        self.reset_caches()
+        await self.request()
+        before = stage_totals()
+        latencies = []
+
+        async def worker():
+            for _ in range(iterations):
+                latencies.append(await self.request())
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+        return {
+            **percentiles(latencies),
+            "concurrency": concurrency,
+            "throughput_rps": round(len(latencies) / wall, 2),
+            "stages_mean_ms": stage_means(before, stage_totals()),
+        }
+
+    async def allocations(self) -> dict:
+        """Python allocations of one cold request; traced separately since tracemalloc slows everything down."""
+        self.reset_caches()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        await self.request()
+        _, peak = tracemalloc.get_traced_memory()
+        diff = tracemalloc.take_snapshot().compare_to(before, "filename")
+        tracemalloc.stop()
+        return {
+            "peak_traced_bytes": peak,
+            "retained_bytes": sum(stat.size_diff for stat in diff),
+            "retained_blocks": sum(stat.count_diff for stat in diff),
+        }
+
+
+async def run(args) -> dict:
+    import httpx
+
+    manifest = load_manifest(args.fixtures)
+    if not manifest:
+        print(f"No recorded fixtures in {args.fixtures}; every feed and image will be synthetic", file=sys.stderr)
+    process, stub_url = start_stub(args.fixtures)
+    try:
+        app_module = import_app()
+        route_through_stub(app_module.recommender.feed_parser.http, stub_url)
+        transport = httpx.ASGITransport(app=app_module.app)
+        report = {
+            "python": sys.version.split()[0],
+            "config": {
+                "iterations": args.iterations,
+                "concurrency": args.concurrency,
+                "nationality": NATIONALITY,
+                "fixtures": os.path.relpath(args.fixtures, REPO_ROOT),
+                # Recorded feeds are replayed; any feed without a recording is synthesized
+                "mode": "replay" if manifest else "synthetic",
+            },
+            "scenarios": {},
+        }
+        recorded_failures = [url for url, entry in manifest.items()
+                             if entry["kind"] == "feed" and entry["status"] != 200]
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            harness = Harness(app_module, client, recorded_failures)
+            for name, interests in scenarios(app_module.feed_manager).items():
+                if args.scenario and name not in args.scenario:
+                    continue
+                print(f"Running {name} ({len(interests)} interests)", file=sys.stderr)
+                harness.login(interests)
+                result = {
+                    "interests": len(interests),
+                    "feeds": len(app_module.feed_manager.get_feeds_for_user(interests, NATIONALITY)),
+                    "cold": await harness.cold(args.iterations),
+                    "warm": await harness.warm(args.iterations, args.concurrency),
+                }
+                if not args.no_allocations:
+                    result["allocations"] = await harness.allocations()
+                result["peak_rss_bytes"] = peak_rss_bytes()
+                report["scenarios"][name] = result
+            session = await app_module.recommender.feed_parser.http.get_session()
+            async with session.get(f"{stub_url}/stats") as response:
+                report["fixtures"] = await response.json()
+            await app_module.recommender.close()
+        return report
+    finally:
+        process.terminate()
+
+
+async def record(args):
+    """Run the all-interests scenario against the real feeds and save every download."""
+    from recommender import TopicBasedRecommender
+
+    os.makedirs(os.path.join(args.fixtures, "bodies"), exist_ok=True)
+    manifest = load_manifest(args.fixtures)
+    recommender = TopicBasedRecommender()
+    http = recommender.feed_parser.http
+    get_bytes = http.get_bytes
+
+    async def recording(url, kind, max_bytes, timeout, headers=None, trace=None):
+        status, body = await get_bytes(url, kind, max_bytes, timeout, headers, trace)
+        if kind == "image" and not args.images:
+            return status, body
+        manifest[url] = {"kind": kind, "status": status, "file": fixture_file(url)}
+        if body is not None:
+            with open(os.path.join(args.fixtures, "bodies", fixture_file(url)), "wb") as f:
+                f.write(body)
+        return status, body
+
+    http.get_bytes = recording
+    random.seed(SEED)
+    interests = scenarios(recommender.feed_manager)["all_interests"]
+    try:
+        feed_urls = recommender.feed_manager.get_feeds_for_user(interests, NATIONALITY)
+        await recommender.get_recommendations("", feed_urls, interests, NATIONALITY)
+    finally:
+        await recommender.close()
+    with open(os.path.join(args.fixtures, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    kinds = Counter(entry["kind"] for entry in manifest.values())
+    print(f"Recorded {kinds['feed']} feeds and {kinds['image']} images to {args.fixtures}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="record feed responses from the network")
+    record_parser.add_argument("--images", action="store_true",
+                               help="record thumbnails too (large); otherwise the stub serves a placeholder")
+    run_parser = subparsers.add_parser("run", help="replay fixtures and measure")
+    run_parser.add_argument("--iterations", type=int, default=10)
+    run_parser.add_argument("--concurrency", type=int, default=4)
+    run_parser.add_argument("--scenario", action="append",
+                            choices=["one_interest", "three_interests", "all_interests"],
+                            help="limit to these scenarios (repeatable)")
+    run_parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+    run_parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # Keep the benchmark from touching the working copy's feed health file
+    os.environ.setdefault("FEED_HEALTH_PATH", os.path.join(tempfile.mkdtemp(), "feed_health.json"))
+    os.environ.setdefault("LOG_LEVEL", "OFF")
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "record":
+        asyncio.run(record(args))
+    else:
+        report = asyncio.run(run(args))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
@@ -0,0 +1,149 @@
+# countries.py
+import logging
+import re
+import unicodedata
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Every bundled country (named after its OPML file) with its ISO 3166 codes, other names and demonyms
+COUNTRY_ALIASES = {
+    "Australia": ["AU", "AUS", "Australian"],
+    "Bangladesh": ["BD", "BGD", "Bangladeshi"],
+    "Brazil": ["BR", "BRA", "Brasil", "Brazilian"],
+    "Canada": ["CA", "CAN", "Canadian"],
+    "France": ["FR", "FRA", "French"],
+    "Germany": ["DE", "DEU", "Deutschland", "German"],
+    "Hong Kong SAR China": ["HK", "HKG", "Hong Kong", "Hong Kong SAR", "Hongkonger"],
+    "India": ["IN", "IND", "Bharat", "Indian"],
+    "Indonesia": ["ID", "IDN", "Indonesian"],
+    "Iran": ["IR", "IRN", "Islamic Republic of Iran", "Persia", "Iranian"],
+    "Ireland": ["IE", "IRL", "Republic of Ireland", "Éire", "Irish"],
+    "Italy": ["IT", "ITA", "Italia", "Italian"],
+    "Japan": ["JP", "JPN", "Nippon", "Japanese"],
+    "Mexico": ["MX", "MEX", "México", "Mexican"],
+    "Myanmar (Burma)": ["MM", "MMR", "Myanmar", "Burma", "Burmese"],
+    "Nigeria": ["NG", "NGA", "Nigerian"],
+    "Pakistan": ["PK", "PAK", "Pakistani"],
+    "Philippines": ["PH", "PHL", "The Philippines", "Filipino", "Philippine"],
+    "Poland": ["PL", "POL", "Polska", "Polish"],
+    "Russia": ["RU", "RUS", "Russian Federation", "Russian"],
+    "South Africa": ["ZA", "ZAF", "RSA", "South African"],
+    "Spain": ["ES", "ESP", "España", "Spanish"],
+    "Ukraine": ["UA", "UKR", "Ukrainian"],
+    "United Kingdom": ["GB", "GBR", "UK", "Great Britain", "Britain", "England", "Scotland", "Wales",
+                       "Northern Ireland", "British", "English", "Scottish", "Welsh"],
+    "United States": ["US", "USA", "U.S.", "U.S.A.", "United States of America", "America", "American"],
+}
+
+# Countries without their own feeds, served the closest bundled ones in order of preference
+REGIONAL_FALLBACKS = {
+    ("New Zealand", "NZ", "NZL"): ["Australia"],
+    ("Austria", "AT", "AUT"): ["Germany"],
+    ("Switzerland", "CH", "CHE"): ["Germany", "France"],
+    ("Liechtenstein", "LI", "LIE"): ["Germany"],
+    ("Belgium", "BE", "BEL"): ["France"],
+    ("Luxembourg", "LU", "LUX"): ["France", "Germany"],
+    ("Monaco", "MC", "MCO"): ["France"],
+    ("Portugal", "PT", "PRT"): ["Brazil", "Spain"],
+    ("Andorra", "AD", "AND"): ["Spain"],
+    ("Argentina", "AR", "ARG"): ["Mexico", "Spain"],
+    ("Chile", "CL", "CHL"): ["Mexico", "Spain"],
+    ("Colombia", "CO", "COL"): ["Mexico", "Spain"],
+    ("Peru", "PE", "PER"): ["Mexico", "Spain"],
+    ("Ecuador", "EC", "ECU"): ["Mexico", "Spain"],
+    ("Uruguay", "UY", "URY"): ["Mexico", "Spain"],
+    ("Guatemala", "GT", "GTM"): ["Mexico"],
+    ("Puerto Rico", "PR", "PRI"): ["United States"],
+    ("China", "CN", "CHN"): ["Hong Kong SAR China"],
+    ("Taiwan", "TW", "TWN"): ["Hong Kong SAR China"],
+    ("Macao", "Macau", "MO", "MAC"): ["Hong Kong SAR China"],
+    ("South Korea", "Korea", "KR", "KOR"): ["Japan"],
+    ("Malaysia", "MY", "MYS"): ["Indonesia"],
+    ("Brunei", "BN", "BRN"): ["Indonesia"],
+    ("Sri Lanka", "LK", "LKA"): ["India"],
+    ("Nepal", "NP", "NPL"): ["India"],
+    ("Bhutan", "BT", "BTN"): ["India"],
+    ("Ghana", "GH", "GHA"): ["Nigeria"],
+    ("Namibia", "NA", "NAM"): ["South Africa"],
+    ("Botswana", "BW", "BWA"): ["South Africa"],
+    ("Lesotho", "LS", "LSO"): ["South Africa"],
+    ("Eswatini", "Swaziland", "SZ", "SWZ"): ["South Africa"],
+}
+
+DEFAULT_COUNTRIES = ["United States"]
+
+# Values profiles hold when there is no nationality; several would otherwise normalize to a
+# real code ("N.A." -> "na", Namibia), so they are caught before the alias lookup
+PLACEHOLDERS = {"", "n/a", "n.a.", "n.a", "na.", "none", "null", "nil", "unknown", "not applicable", "-", "--", "?"}
+
+
+def normalize_country(value: str) -> str:
+    """Case-, accent- and punctuation-insensitive form of a country name or code ("U.S." -> "us").
+
+    Dots and apostrophes are dropped; any other punctuation separates words, so "N/A" becomes
+    "n a" rather than the code "na".
+    """
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c)).casefold()
+    value = re.sub(r"[.'\u2019]", "", value)
+    return " ".join(re.sub(r"[^\w\s]", " ", value).split())
+
+
+class CountryResolver:
+    """Maps whatever a user profile holds as nationality to bundled countries.
+
+    Every accepted spelling is normalized once at construction into one lookup table, so
+    resolving is a dict lookup (two for spellings not seen before). The result is a
+    preference-ordered chain: the country itself, or its regional fallbacks, followed by
+    the defaults. Only countries that are actually bundled ever appear in a chain.
+    """
+
+    def __init__(self, bundled: Iterable[str],
+                 aliases: Optional[Dict[str, Sequence[str]]] = None,
+                 regional_fallbacks: Optional[Dict[Tuple[str, ...], Sequence[str]]] = None,
+                 defaults: Optional[Sequence[str]] = None,
+                 max_memo: int = 4096):
+        bundled = list(bundled)
+        aliases = COUNTRY_ALIASES if aliases is None else aliases
+        regional_fallbacks = REGIONAL_FALLBACKS if regional_fallbacks is None else regional_fallbacks
+        defaults = DEFAULT_COUNTRIES if defaults is None else defaults
+
+        self.defaults = tuple(country for country in defaults if country in bundled)
+        self._lookup: Dict[str, Tuple[str, ...]] = {}
+        for names, fallbacks in regional_fallbacks.items():
+            chain = self._chain(country for country in fallbacks if country in bundled)
+            for name in names:
+                self._lookup[normalize_country(name)] = chain
+        # Bundled countries go last so their own names always win over a regional entry
+        for country in bundled:
+            chain = self._chain([country])
+            for name in [country, *aliases.get(country, [])]:
+                self._lookup[normalize_country(name)] = chain
+
+        self._memo: Dict[str, Tuple[str, ...]] = {}
+        self.max_memo = max_memo
+
+    def _chain(self, countries: Iterable[str]) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys([*countries, *self.defaults]))
+
+    def resolve_chain(self, nationality: Optional[str]) -> Tuple[str, ...]:
+        """Bundled countries to serve for this nationality, most specific first."""
+        chain = self._memo.get(nationality)
+        if chain is not None:
+            return chain
+        if (nationality or "").strip().casefold() in PLACEHOLDERS:
+            chain = None
+        else:
+            chain = self._lookup.get(normalize_country(nationality))
+        if chain is None:
+            logger.debug("Unknown nationality %r, using defaults", nationality)
+            chain = self.defaults
+        if len(self._memo) < self.max_memo:
+            self._memo[nationality] = chain
+        return chain
+
+    def resolve(self, nationality: Optional[str]) -> Optional[str]:
+        """The bundled country whose feeds this nationality gets, or None if nothing is bundled."""
+        chain = self.resolve_chain(nationality)
+        return chain[0] if chain else None
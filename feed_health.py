@@ -0,0 +1,202 @@
+# feed_health.py
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from metrics import Counter, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FEED_SKIPS = REGISTRY.register(Counter(
+    "neo_feed_skipped_total",
+    "Feed fetches skipped because the feed circuit was open or the feed is quarantined.",
+    ["reason"],
+))
+
+
+class FeedHealth:
+    """Rolling health state for a single feed URL."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.error_rate = 0.0       # EWMA of failures, 0.0 (healthy) .. 1.0 (always failing)
+        self.latency_ewma = None    # seconds, None until the first timed fetch
+        self.last_success = None    # unix timestamps
+        self.last_failure = None
+        self.last_error = None
+        self.open_until = 0.0       # circuit is open (feed skipped) until this time
+        self.quarantined = False
+        self.quarantine_probe_at = 0.0
+
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FeedHealth":
+        health = cls(data["url"])
+        for key, value in data.items():
+            if hasattr(health, key):
+                setattr(health, key, value)
+        return health
+
+
+class FeedHealthTracker:
+    def __init__(self,
+                 path: Optional[str] = None,
+                 alpha: float = 0.3,
+                 failure_threshold: int = 3,
+                 base_backoff: float = 60.0,
+                 max_backoff: float = 6 * 3600.0,
+                 slow_threshold: float = 5.0,
+                 min_samples: int = 3,
+                 quarantine_probe_interval: float = 3600.0,
+                 probe_timeout: float = 15.0,
+                 save_interval: float = 300.0):
+        self.path = path if path is not None else os.environ.get("FEED_HEALTH_PATH", "feed_health.json")
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.slow_threshold = slow_threshold
+        self.min_samples = min_samples
+        self.quarantine_probe_interval = quarantine_probe_interval
+        self.probe_timeout = probe_timeout
+        self.save_interval = save_interval
+        self.feeds: Dict[str, FeedHealth] = {}
+        self._last_save = time.time()
+        self._lock = threading.Lock()
+        self.load()
+
+    def _get(self, url: str) -> FeedHealth:
+        health = self.feeds.get(url)
+        if health is None:
+            health = self.feeds[url] = FeedHealth(url)
+        return health
+
+    def should_skip(self, url: str) -> bool:
+        """Return True if the feed should not be fetched right now.
+
+        Open circuits are skipped until their backoff expires, after which a single
+        half-open probe is let through. Quarantined feeds get one probe per
+        quarantine_probe_interval.
+        """
+        health = self.feeds.get(url)
+        if health is None:
+            return False
+        now = time.time()
+        if health.quarantined:
+            if now < health.quarantine_probe_at:
+                FEED_SKIPS.inc(reason="quarantined")
+                return True
+            health.quarantine_probe_at = now + self.quarantine_probe_interval
+            return False
+        if now < health.open_until:
+            FEED_SKIPS.inc(reason="circuit_open")
+            return True
+        if health.consecutive_failures >= self.failure_threshold:
+            # Half-open: this caller probes, everyone else keeps skipping until it resolves
+            health.open_until = now + self.probe_timeout
+        return False
+
+    def record_success(self, url: str, latency: float):
+        health = self._get(url)
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.open_until = 0.0
+        health.last_success = time.time()
+        health.error_rate = (1 - self.alpha) * health.error_rate
+        self._update_latency(health, latency)
+
+        total = health.successes + health.failures
+        if health.latency_ewma > self.slow_threshold and total >= self.min_samples:
+            if not health.quarantined:
+                logger.warning("Quarantining slow feed %s (latency EWMA %.2fs)", url, health.latency_ewma)
+                health.quarantined = True
+                health.quarantine_probe_at = health.last_success + self.quarantine_probe_interval
+        elif health.quarantined:
+            logger.info("Releasing feed %s from quarantine", url)
+            health.quarantined = False
+
+    def record_failure(self, url: str, error: str, latency: Optional[float] = None):
+        health = self._get(url)
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.last_failure = time.time()
+        health.last_error = error
+        health.error_rate = (1 - self.alpha) * health.error_rate + self.alpha
+        if latency is not None:
+            self._update_latency(health, latency)
+
+        if health.consecutive_failures >= self.failure_threshold:
+            exponent = health.consecutive_failures - self.failure_threshold
+            backoff = min(self.base_backoff * (2 ** exponent), self.max_backoff)
+            health.open_until = health.last_failure + backoff
+            logger.info("Opening circuit for %s for %.0fs after %d consecutive failures",
+                        url, backoff, health.consecutive_failures)
+
+    def _update_latency(self, health: FeedHealth, latency: float):
+        if health.latency_ewma is None:
+            health.latency_ewma = latency
+        else:
+            health.latency_ewma = (1 - self.alpha) * health.latency_ewma + self.alpha * latency
+
+    def state(self, url: str) -> str:
+        health = self.feeds.get(url)
+        if health is None:
+            return "unknown"
+        if health.quarantined:
+            return "quarantined"
+        if time.time() < health.open_until:
+            return "open"
+        if health.consecutive_failures >= self.failure_threshold:
+            return "half_open"
+        return "closed"
+
+    def report(self, limit: Optional[int] = 20) -> List[Dict]:
+        """Feeds ordered worst first: by error rate, then by latency."""
+        worst = sorted(
+            self.feeds.values(),
+            key=lambda h: (h.error_rate, h.latency_ewma or 0.0),
+            reverse=True,
+        )
+        if limit is not None:
+            worst = worst[:limit]
+        return [dict(h.to_dict(), state=self.state(h.url)) for h in worst]
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.feeds = {item["url"]: FeedHealth.from_dict(item) for item in data.get("feeds", [])}
+            logger.info("Loaded health state for %d feeds from %s", len(self.feeds), self.path)
+        except Exception as e:
+            logger.warning("Could not load feed health from %s: %s", self.path, e)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            # list() snapshots the values so a save running in a worker thread does not
+            # race with the event loop adding new feeds
+            data = {"saved_at": time.time(), "feeds": [h.to_dict() for h in list(self.feeds.values())]}
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+                self._last_save = time.time()
+            except OSError as e:
+                logger.warning("Could not save feed health to %s: %s", self.path, e)
+
+    def maybe_save(self):
+        """Persist the state if save_interval has elapsed since the last save."""
+        if time.time() - self._last_save >= self.save_interval:
+            self.save()
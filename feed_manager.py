@@ -1,10 +1,18 @@
 # feed_manager.py
+import logging
 import os
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
 from xml.etree import ElementTree as ET
 
+from countries import CountryResolver
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
 class FeedManager:
-    def __init__(self, base_dir: str = "opml"):
+    def __init__(self, base_dir: str = "opml",
+                 country_fallbacks: Optional[Sequence[str]] = None,
+                 regional_fallbacks: Optional[Dict[Tuple[str, ...], Sequence[str]]] = None):
         self.base_dir = base_dir
         self.cache = {}
 
@@ -26,42 +34,40 @@ class FeedManager:
             # Customize or expand as needed
         }
 
-        # Default country opml files to use when country file is not found
-        self.country_fallbacks = ["United States.opml"]
+        # Countries served when a nationality is unknown or its own feeds are empty
+        self.country_fallbacks = list(country_fallbacks or ["United States"])
+
+        # The bundled countries are listed once; after that nationality lookups never touch the filesystem
+        countries_dir = os.path.join(self.base_dir, "countries_without_category")
+        bundled = sorted(
+            file_name[:-len(".opml")] for file_name in (os.listdir(countries_dir) if os.path.isdir(countries_dir) else [])
+            if file_name.endswith(".opml")
+        )
+        self.countries = CountryResolver(bundled, regional_fallbacks=regional_fallbacks, defaults=self.country_fallbacks)
+        self._country_feeds: Dict[str, List[str]] = {}
+
+    def get_country_feeds(self, nationality: str) -> List[str]:
+        """Feeds for a nationality in any accepted spelling: its country's, else the first
+        non-empty country down its fallback chain."""
+        feeds = self._country_feeds.get(nationality)
+        if feeds is not None:
+            return feeds
+
+        feeds = []
+        for country in self.countries.resolve_chain(nationality):
+            feeds = self._load_opml_cached(os.path.join(self.base_dir, "countries_without_category", f"{country}.opml"))
+            if feeds:
+                break
+            logger.warning("No feeds extracted for %s, trying next fallback", country)
+        if len(self._country_feeds) < 4096:
+            self._country_feeds[nationality] = feeds
+        return feeds
 
     def get_feeds_for_user(self, interests: List[str], nationality: str) -> List[str]:
         feed_urls = []
         
         # 1. Load nationality feeds
-        nationality_path = os.path.join(self.base_dir, "countries_without_category", f"{nationality}.opml")
-        print(f"[DEBUG] Looking for nationality file: {nationality_path}")
-        
-        if os.path.exists(nationality_path):
-            print(f"[DEBUG] Found nationality file: {nationality_path}")
-            nationality_feeds = self._load_opml_cached(nationality_path)
-            
-            # If parsing failed but file exists, try editing it
-            if not nationality_feeds:
-                print(f"[DEBUG] No feeds extracted from {nationality_path}, attempting to fix the file")
-                # You could implement automatic fixing here
-            
-            feed_urls += nationality_feeds
-        else:
-            print(f"[DEBUG] Nationality file not found, trying fallbacks")
-            # Try fallback countries if the requested one doesn't exist
-            for fallback in self.country_fallbacks:
-                fallback_path = os.path.join(self.base_dir, "countries_without_category", fallback)
-                print(f"[DEBUG] Trying fallback: {fallback_path}")
-                if os.path.exists(fallback_path):
-                    print(f"[DEBUG] Found fallback file: {fallback_path}")
-                    fallback_feeds = self._load_opml_cached(fallback_path)
-                    if fallback_feeds:
-                        feed_urls += fallback_feeds
-                        break
-                    else:
-                        print(f"[DEBUG] No feeds extracted from fallback {fallback_path}")
-                else:
-                    print(f"[DEBUG] Fallback not found: {fallback_path}")
+        feed_urls += self.get_country_feeds(nationality)
 
         # 2. Load interest feeds
         for interest in interests:
@@ -81,14 +87,28 @@ class FeedManager:
 
         return list(set(feed_urls))  # Remove duplicates
 
-    def _load_opml_cached(self, file_path: str) -> List[str]:
-        if not os.path.exists(file_path):
-            print(f"[FeedManager] OPML file not found: {file_path}")
-            return []
+    def preload(self) -> int:
+        """Parse every bundled OPML file into the cache and return how many feeds were loaded."""
+        total = 0
+        for sub_dir in ("countries_without_category", "interests_without_category"):
+            dir_path = os.path.join(self.base_dir, sub_dir)
+            if not os.path.isdir(dir_path):
+                continue
+            for file_name in sorted(os.listdir(dir_path)):
+                if file_name.endswith('.opml'):
+                    total += len(self._load_opml_cached(os.path.join(dir_path, file_name)))
+        return total
 
+    def _load_opml_cached(self, file_path: str) -> List[str]:
         if file_path in self.cache:
+            record_cache("opml", hit=True)
             return self.cache[file_path]
 
+        record_cache("opml", hit=False)
+        if not os.path.exists(file_path):
+            logger.warning("OPML file not found: %s", file_path)
+            return []
+
         urls = self._parse_opml(file_path)
         self.cache[file_path] = urls
         return urls
@@ -105,7 +125,7 @@ class FeedManager:
                 if xml_url:
                     urls.append(xml_url)
         except ET.ParseError as e:
-            print(f"[FeedManager] Initial parsing failed for {file_path}: {e}")
+            logger.warning("Initial parsing failed for %s: %s", file_path, e)
             # Try to fix common issues
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
@@ -124,9 +144,9 @@ class FeedManager:
                     xml_url = outline.attrib.get('xmlUrl')
                     if xml_url:
                         urls.append(xml_url)
-                print(f"[FeedManager] Successfully parsed {file_path} after applying fixes")
+                logger.info("Successfully parsed %s after applying fixes", file_path)
             except Exception as inner_e:
-                print(f"[FeedManager] Failed to parse {file_path} even after fixes: {inner_e}")
+                logger.warning("Failed to parse %s even after fixes: %s", file_path, inner_e)
                 # If still failing, try a more aggressive approach
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
@@ -138,7 +158,7 @@ class FeedManager:
                     matches = re.findall(pattern, content)
                     if matches:
                         urls.extend(matches)
-                        print(f"[FeedManager] Extracted {len(matches)} URLs using regex from {file_path}")
+                        logger.info("Extracted %d URLs using regex from %s", len(matches), file_path)
                 except Exception as regex_e:
-                    print(f"[FeedManager] Regex extraction also failed for {file_path}: {regex_e}")
+                    logger.error("Regex extraction also failed for %s: %s", file_path, regex_e)
         return urls
\ No newline at end of file
@@ -1,107 +1,191 @@
-import feedparser
-import aiohttp
-import numpy as np
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
 import base64
 from io import BytesIO
-from PIL import Image
+import random
 import re
 import asyncio
+import logging
+import time
+
+from feed_health import FeedHealthTracker
+from http_client import FEED_TIMEOUT, IMAGE_TIMEOUT, MAX_FEED_BYTES, MAX_IMAGE_BYTES, HttpClient
+from metrics import FEED_FETCH_LATENCY, Counter, REGISTRY, record_cache, span
+
+logger = logging.getLogger(__name__)
+
+FEED_FETCHES_COALESCED = REGISTRY.register(Counter(
+    "neo_feed_fetches_coalesced_total",
+    "Feed cache misses served by joining a fetch of the same URL that was already in flight.",
+))
+
+
+def import_parsers():
+    """Import the feed, HTML and image libraries.
+
+    They are only needed once the first feed is fetched, so importing them lazily keeps
+    them off the cold-start path; warm_up() calls this ahead of the first request.
+    """
+    import feedparser
+    from bs4 import BeautifulSoup
+    from PIL import Image
+    return feedparser, BeautifulSoup, Image
+
 
 class FeedParser:
     def __init__(self):
-        self.session = None
+        self.http = HttpClient()
         self.feed_cache = {}
         self.cache_expiry = timedelta(hours=2)
-
-    async def get_session(self):
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
-        return self.session
+        # Each entry lives cache_expiry +/- this fraction, so feeds fetched together do not all expire together
+        self.cache_expiry_jitter = 0.1
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # Called with the entries of every feed that leaves the cache, so caches built on them can let go
+        self.evict_listeners: List[Callable[[List[Dict]], None]] = []
+        self.health = FeedHealthTracker()
 
     async def fetch_image(self, image_url: str) -> Optional[str]:
         if not image_url:
             return None
+        _, _, Image = import_parsers()
         try:
-            session = await self.get_session()
-            async with session.get(image_url) as response:
-                if response.status == 200:
-                    image_data = await response.read()
-                    img = Image.open(BytesIO(image_data)).convert('RGB')
-                    if img.size[0] > 300 or img.size[1] > 300:
-                        img.thumbnail((300, 300))
-                    buffered = BytesIO()
-                    img.save(buffered, format="JPEG")
-                    return f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
-                return None
-        except Exception:
+            with span("image"):
+                status, image_data = await self.http.get_bytes(
+                    image_url, "image", MAX_IMAGE_BYTES, IMAGE_TIMEOUT
+                )
+                if status != 200:
+                    return None
+                img = Image.open(BytesIO(image_data))
+                # Let the JPEG decoder downscale while decoding instead of materialising the full image
+                img.draft('RGB', (300, 300))
+                img = img.convert('RGB')
+                if img.size[0] > 300 or img.size[1] > 300:
+                    img.thumbnail((300, 300))
+                buffered = BytesIO()
+                img.save(buffered, format="JPEG")
+                return f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
+        except Exception as e:
+            logger.debug("Image fetch failed for %s: %s", image_url, e)
             return None
 
+    def _evict(self, url: str):
+        cached_feed = self.feed_cache.pop(url, None)
+        if cached_feed:
+            for listener in self.evict_listeners:
+                listener(cached_feed['entries'])
+
+    def prune_cache(self):
+        """Drop every expired feed from the cache, including feeds nobody requests any more."""
+        now = datetime.now()
+        for url in [url for url, cached_feed in self.feed_cache.items() if now >= cached_feed['expiry']]:
+            self._evict(url)
+
     async def parse_feed(self, url: str, auth: Optional[Dict] = None) -> List[Dict]:
         cached_feed = self.feed_cache.get(url)
         if cached_feed and datetime.now() < cached_feed['expiry']:
+            record_cache("feed", hit=True)
             return cached_feed['entries']
+        record_cache("feed", hit=False)
+        if cached_feed:
+            self._evict(url)
+
+        # Single flight: concurrent misses for a URL share one download and parse. The fetch
+        # is shielded so a caller that gets cancelled does not cancel it for everyone else.
+        fetch = self._in_flight.get(url)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch_feed(url, auth))
+            self._in_flight[url] = fetch
+            fetch.add_done_callback(lambda _: self._in_flight.pop(url, None))
+        else:
+            FEED_FETCHES_COALESCED.inc()
+        return await asyncio.shield(fetch)
+
+    async def _fetch_feed(self, url: str, auth: Optional[Dict] = None) -> List[Dict]:
+        if self.health.should_skip(url):
+            logger.debug("Skipping unhealthy feed %s (%s)", url, self.health.state(url))
+            return []
 
+        feedparser, BeautifulSoup, _ = import_parsers()
+        # Health only sees time spent on the feed's host, not time queued for one of our connections
+        trace = {}
+        fetch_start = time.perf_counter()
+        fetch_latency = None
         try:
-            session = await self.get_session()
             headers = {'User-Agent': 'Mozilla/5.0'}
             if auth:
                 headers.update(auth)
 
-            async with session.get(url, timeout=10, headers=headers) as response:
-                if response.status != 200:
-                    return []
+            with span("fetch", feed=url):
+                # Raw bytes go straight to feedparser, which honours the XML encoding declaration
+                status, feed_content = await self.http.get_bytes(
+                    url, "feed", MAX_FEED_BYTES, FEED_TIMEOUT, headers=headers, trace=trace
+                )
+            fetch_latency = time.perf_counter() - trace.get("acquired", fetch_start)
+            FEED_FETCH_LATENCY.observe(fetch_latency, feed=url)
+            if status != 200:
+                logger.debug("Feed %s returned HTTP %s", url, status)
+                self.health.record_failure(url, f"HTTP {status}", fetch_latency)
+                return []
 
-                feed_content = await response.text()
+            with span("parse", feed=url):
                 feed = feedparser.parse(feed_content)
-                all_entries = feed.entries
-                np.random.shuffle(all_entries)
-                entries = []
-                for entry in all_entries[:20]:
-                    thumbnail = None
-                    if hasattr(entry, 'media_thumbnail'):
-                        thumbnail = entry.media_thumbnail[0]['url']
-                    elif hasattr(entry, 'media_content'):
-                        thumbnail = entry.media_content[0]['url']
-                    else:
-                        content = entry.get('description', '') or entry.get('summary', '')
-                        soup = BeautifulSoup(content, 'html.parser')
-                        img = soup.find('img')
-                        if img and img.get('src'):
-                            thumbnail = img['src']
-
-                    thumbnail_data = await self.fetch_image(thumbnail) if thumbnail else None
-                    published = entry.get('published_parsed') or entry.get('updated_parsed')
-                    if published:
-                        published = datetime(*published[:6]).isoformat()
-
-                    entries.append({
-                        'title': entry.get('title', ''),
-                        'description': self._clean_html(entry.get('description', '') or entry.get('summary', '')),
-                        'link': entry.get('link', ''),
-                        'published': published,
-                        'thumbnail': thumbnail_data,
-                        'author': entry.get('author', ''),
-                        'categories': entry.get('tags', []),
-                    })
-                self.feed_cache[url] = {
-                    'entries': entries,
-                    'expiry': datetime.now() + self.cache_expiry
-                }
-                return entries
-
-        except Exception:
+            all_entries = feed.entries
+            random.shuffle(all_entries)
+            entries = []
+            for entry in all_entries[:20]:
+                thumbnail = None
+                if hasattr(entry, 'media_thumbnail'):
+                    thumbnail = entry.media_thumbnail[0]['url']
+                elif hasattr(entry, 'media_content'):
+                    thumbnail = entry.media_content[0]['url']
+                else:
+                    content = entry.get('description', '') or entry.get('summary', '')
+                    soup = BeautifulSoup(content, 'html.parser')
+                    img = soup.find('img')
+                    if img and img.get('src'):
+                        thumbnail = img['src']
+
+                thumbnail_data = await self.fetch_image(thumbnail) if thumbnail else None
+                published = entry.get('published_parsed') or entry.get('updated_parsed')
+                if published:
+                    published = datetime(*published[:6]).isoformat()
+
+                entries.append({
+                    'title': entry.get('title', ''),
+                    'description': self._clean_html(entry.get('description', '') or entry.get('summary', '')),
+                    'link': entry.get('link', ''),
+                    'published': published,
+                    'thumbnail': thumbnail_data,
+                    'author': entry.get('author', ''),
+                    'categories': entry.get('tags', []),
+                })
+            self._evict(url)
+            self.feed_cache[url] = {
+                'entries': entries,
+                'expiry': datetime.now() + self.cache_expiry * random.uniform(
+                    1 - self.cache_expiry_jitter, 1 + self.cache_expiry_jitter
+                )
+            }
+            self.health.record_success(url, fetch_latency)
+            return entries
+
+        except Exception as e:
+            logger.debug("Feed %s failed: %s", url, e)
+            if isinstance(e, asyncio.TimeoutError) and "acquired" not in trace:
+                # Timed out waiting for a connection of our own pool, which says nothing about the feed
+                return []
+            if fetch_latency is None:
+                fetch_latency = time.perf_counter() - trace.get("acquired", fetch_start)
+            self.health.record_failure(url, repr(e), fetch_latency)
             return []
 
     def _clean_html(self, html_content: str) -> str:
+        _, BeautifulSoup, _ = import_parsers()
         soup = BeautifulSoup(html_content, 'html.parser')
         text = soup.get_text()
         text = re.sub(r'\s+', ' ', text).strip()
         return text[:200] + '...' if len(text) > 200 else text
 
     async def close(self):
-        if self.session:
-            await self.session.close()
-            self.session = None
\ No newline at end of file
+        self.health.save()
+        await self.http.close()
\ No newline at end of file
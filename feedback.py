@@ -0,0 +1,142 @@
+# feedback.py
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics import Counter, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_CLICKS = REGISTRY.register(Counter(
+    "neo_feedback_clicks_total",
+    "Article clicks recorded through the feedback endpoint.",
+))
+
+FEEDBACK_WRITES = REGISTRY.register(Counter(
+    "neo_feedback_writes_total",
+    "User vectors written to storage, by result.",
+    ["result"],
+))
+
+# Firestore rejects batches of more than 500 writes
+MAX_BATCH_WRITES = 500
+
+# Vector versions are drawn from one process-wide sequence, so a vector reseeded from storage
+# after eviction can never reuse the cache key of an earlier state of the same user
+_versions = itertools.count()
+
+
+class UserTermVector:
+    """Term weights learned from one user's clicks.
+
+    Each click decays every existing weight by `decay` and adds 1 to each term of the
+    clicked article. The decay is kept as a shared scale factor rather than applied to
+    every entry, so a click costs O(terms in the article); the vector is pruned back to
+    its max_terms heaviest terms once it grows to twice that.
+    """
+
+    def __init__(self, uid: str, weights: Optional[Dict[str, float]] = None,
+                 decay: float = 0.9, max_terms: int = 200):
+        self.uid = uid
+        self.decay = decay
+        self.max_terms = max_terms
+        self._weights = dict(weights or {})  # stored weight = effective weight / _scale
+        self._scale = 1.0
+        self.version = next(_versions)
+
+    def __len__(self):
+        return len(self._weights)
+
+    @property
+    def cache_key(self) -> Tuple[str, int]:
+        return (self.uid, self.version)
+
+    def update(self, terms: Iterable[str]):
+        self._scale *= self.decay
+        increment = 1.0 / self._scale
+        for term in set(terms):
+            self._weights[term] = self._weights.get(term, 0.0) + increment
+        self.version = next(_versions)
+        if self._scale < 1e-6 or len(self._weights) > 2 * self.max_terms:
+            self._compact()
+
+    def _compact(self):
+        self._weights = dict(heapq.nlargest(self.max_terms, self.as_dict().items(), key=lambda item: item[1]))
+        self._scale = 1.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {term: weight * self._scale for term, weight in self._weights.items()}
+
+
+class FeedbackStore:
+    """In-memory user vectors with write-behind persistence.
+
+    Clicks only touch memory; changed vectors are written to the term_weights field of
+    the users collection in batches every flush_interval seconds by run(), so neither
+    the feedback endpoint nor recommendations ever wait on storage. Vectors are seeded
+    from the user document that get_current_user already reads, and the least recently
+    used are dropped from memory beyond max_users (after their pending write).
+    """
+
+    def __init__(self, db, collection: str = "users", flush_interval: float = 30.0, max_users: int = 10000):
+        self.db = db
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        self._vectors = OrderedDict()
+        self._dirty: Dict[str, UserTermVector] = {}
+
+    def get(self, uid: str, stored_weights: Optional[Dict[str, float]] = None) -> Optional[UserTermVector]:
+        vector = self._vectors.get(uid)
+        if vector is not None:
+            self._vectors.move_to_end(uid)
+            return vector
+        if not stored_weights:
+            return None
+        return self._remember(UserTermVector(uid, stored_weights))
+
+    def record_click(self, uid: str, terms: List[str],
+                     stored_weights: Optional[Dict[str, float]] = None) -> UserTermVector:
+        vector = self.get(uid, stored_weights) or self._remember(UserTermVector(uid))
+        vector.update(terms)
+        self._dirty[uid] = vector
+        FEEDBACK_CLICKS.inc()
+        return vector
+
+    def _remember(self, vector: UserTermVector) -> UserTermVector:
+        self._vectors[vector.uid] = vector
+        while len(self._vectors) > self.max_users:
+            self._vectors.popitem(last=False)
+        return vector
+
+    def _write(self, writes: List[Tuple[str, Dict[str, float]]]):
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for uid, weights in writes[start:start + MAX_BATCH_WRITES]:
+                # Replace the whole map so terms pruned from the vector are dropped from storage too
+                batch.set(self.db.collection(self.collection).document(uid),
+                          {"term_weights": weights}, merge=["term_weights"])
+            batch.commit()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        # Snapshot on the event loop so the writer thread never sees a vector mid-update
+        writes = [(uid, vector.as_dict()) for uid, vector in dirty.items()]
+        try:
+            await asyncio.to_thread(self._write, writes)
+            FEEDBACK_WRITES.inc(len(writes), result="ok")
+        except Exception as e:
+            logger.warning("Writing %d user vectors failed, will retry: %s", len(writes), e)
+            FEEDBACK_WRITES.inc(len(writes), result="error")
+            for uid, vector in dirty.items():
+                self._dirty.setdefault(uid, vector)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -0,0 +1,156 @@
+# http_client.py
+import time
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from metrics import Counter, Gauge, REGISTRY
+
+# Feeds are a few hundred KB at most; anything larger is a misconfigured endpoint or an archive dump.
+MAX_FEED_BYTES = 5 * 1024 * 1024
+# Thumbnails are downscaled to 300x300, so a multi-megabyte original is never worth the download.
+MAX_IMAGE_BYTES = 2 * 1024 * 1024
+
+# aiohttp's connect timeout also covers waiting for a free pool slot, so the handshake is
+# bounded by sock_connect instead and queueing behind other downloads only counts against total.
+FEED_TIMEOUT = aiohttp.ClientTimeout(total=20, sock_connect=3, sock_read=5)
+IMAGE_TIMEOUT = aiohttp.ClientTimeout(total=10, sock_connect=2, sock_read=3)
+
+# (limit, limit_per_host) of each request kind's pool. Kinds get separate pools so the
+# thumbnails of one feed never hold the connections other feeds are waiting for.
+POOL_LIMITS = {"feed": (100, 8), "image": (50, 4)}
+
+CHUNK_SIZE = 64 * 1024
+
+HTTP_CONNECTIONS = REGISTRY.register(Counter(
+    "neo_http_connections_total",
+    "Connections used for outgoing requests, by request kind and whether the connection was new or reused.",
+    ["kind", "result"],
+))
+
+HTTP_RESPONSES_TOO_LARGE = REGISTRY.register(Counter(
+    "neo_http_responses_too_large_total",
+    "Responses aborted because they exceeded the size limit for their kind.",
+    ["kind"],
+))
+
+
+def _connection_reuse_ratios() -> Dict[Tuple, float]:
+    kinds = {key[0] for key in list(HTTP_CONNECTIONS._values)}
+    ratios = {}
+    for kind in kinds:
+        reused = HTTP_CONNECTIONS.get(kind=kind, result="reused")
+        total = reused + HTTP_CONNECTIONS.get(kind=kind, result="new")
+        ratios[(kind,)] = reused / total if total else 0.0
+    return ratios
+
+
+REGISTRY.register(Gauge(
+    "neo_http_connection_reuse_ratio",
+    "Fraction of outgoing requests served over a pooled keep-alive connection.",
+    ["kind"],
+    callback=_connection_reuse_ratios,
+))
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+async def _on_connection_create_start(session, context, params):
+    # A pool slot has been granted; time from here on is spent on the remote host
+    if context.trace_request_ctx is not None:
+        context.trace_request_ctx.setdefault("acquired", time.perf_counter())
+
+
+async def _on_connection_create_end(session, context, params):
+    kind = (context.trace_request_ctx or {}).get("kind", "other")
+    HTTP_CONNECTIONS.inc(kind=kind, result="new")
+
+
+async def _on_connection_reuseconn(session, context, params):
+    kind = (context.trace_request_ctx or {}).get("kind", "other")
+    HTTP_CONNECTIONS.inc(kind=kind, result="reused")
+    if context.trace_request_ctx is not None:
+        context.trace_request_ctx.setdefault("acquired", time.perf_counter())
+
+
+class HttpClient:
+    """Shared aiohttp sessions with explicitly sized, keep-alive connection pools, one per request kind.
+
+    The connectors cache DNS lookups, keep idle connections open for reuse across
+    requests and race IPv6/IPv4 connects (happy eyeballs) so a broken address family
+    does not cost the whole connect timeout.
+    """
+
+    def __init__(self,
+                 limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 dns_cache_ttl: int = 600,
+                 keepalive_timeout: float = 30.0,
+                 happy_eyeballs_delay: float = 0.25):
+        self.limits = dict(POOL_LIMITS if limits is None else limits)
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    async def get_session(self, kind: str = "feed") -> aiohttp.ClientSession:
+        # Kinds without limits of their own share the feed pool
+        pool = kind if kind in self.limits else "feed"
+        session = self.sessions.get(pool)
+        if session is None or session.closed:
+            limit, limit_per_host = self.limits[pool]
+            connector = aiohttp.TCPConnector(
+                limit=limit,
+                limit_per_host=limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+                happy_eyeballs_delay=self.happy_eyeballs_delay,
+                enable_cleanup_closed=True,
+            )
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_start.append(_on_connection_create_start)
+            trace_config.on_connection_create_end.append(_on_connection_create_end)
+            trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+            session = self.sessions[pool] = aiohttp.ClientSession(
+                connector=connector,
+                timeout=FEED_TIMEOUT,
+                trace_configs=[trace_config],
+            )
+        return session
+
+    async def get_bytes(self, url: str, kind: str, max_bytes: int,
+                        timeout: aiohttp.ClientTimeout,
+                        headers: Optional[Dict] = None,
+                        trace: Optional[Dict] = None) -> Tuple[int, Optional[bytes]]:
+        """GET url and return (status, body), streaming the body and aborting past max_bytes.
+
+        The body is None for non-200 responses, which are not read at all. If a trace dict
+        is passed, its "acquired" key is set to the perf_counter() time a connection was
+        obtained from the pool; it stays unset if the request never got one.
+        """
+        session = await self.get_session(kind)
+        trace_ctx = {} if trace is None else trace
+        trace_ctx["kind"] = kind
+        async with session.get(url, headers=headers, timeout=timeout,
+                               trace_request_ctx=trace_ctx) as response:
+            if response.status != 200:
+                return response.status, None
+
+            if response.content_length is not None and response.content_length > max_bytes:
+                HTTP_RESPONSES_TOO_LARGE.inc(kind=kind)
+                raise ResponseTooLarge(f"{url} declares {response.content_length} bytes (limit {max_bytes})")
+
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                body.extend(chunk)
+                if len(body) > max_bytes:
+                    HTTP_RESPONSES_TOO_LARGE.inc(kind=kind)
+                    raise ResponseTooLarge(f"{url} exceeded {max_bytes} bytes")
+            return response.status, bytes(body)
+
+    async def close(self):
+        sessions, self.sessions = self.sessions, {}
+        for session in sessions.values():
+            await session.close()
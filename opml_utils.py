@@ -1,8 +1,23 @@
 import os
 import re
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from xml.etree import ElementTree as ET
 import xml.sax.saxutils as saxutils
 
+MANIFEST_NAME = ".opml_manifest.json"
+CATALOG_NAME = "catalog.json"
+
+UNESCAPED_AMPERSAND_RE = re.compile(r'&(?!(amp|lt|gt|apos|quot|#\d+|#x[0-9a-fA-F]+);)')
+UNQUOTED_ATTRIBUTE_RE = re.compile(r'=(\w+)(\s+|\>)')
+SELF_CLOSING_TAG_RE = re.compile(r'<([\w:]+)([^>]*)/>')
+INVALID_XML_CHARS_RE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F]')
+# Last-resort feed extraction, the same FeedManager applies to files that will not parse
+XML_URL_RE = re.compile(r'xmlUrl="([^"]+)"')
+
 def read_file_content(file_path):
     """Read file content with different encodings."""
     encodings = ['utf-8', 'latin-1', 'cp1252']
@@ -33,16 +48,16 @@ def fix_xml_structure(content):
 def fix_common_xml_issues(content):
     """Fix common XML issues that might cause parsing errors."""
     # Replace unescaped ampersands not part of an entity
-    content = re.sub(r'&(?!(amp|lt|gt|apos|quot|#\d+|#x[0-9a-fA-F]+);)', '&amp;', content)
+    content = UNESCAPED_AMPERSAND_RE.sub('&amp;', content)
     
     # Fix missing quotes around attribute values
-    content = re.sub(r'=(\w+)(\s+|\>)', r'="\1"\2', content)
+    content = UNQUOTED_ATTRIBUTE_RE.sub(r'="\1"\2', content)
     
     # Fix self-closing tags
-    content = re.sub(r'<([\w:]+)([^>]*)/>', r'<\1\2 />', content)
+    content = SELF_CLOSING_TAG_RE.sub(r'<\1\2 />', content)
     
     # Remove invalid XML characters
-    content = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F]', '', content)
+    content = INVALID_XML_CHARS_RE.sub('', content)
     
     # Ensure proper XML declaration
     if not content.strip().startswith('<?xml'):
@@ -50,20 +65,25 @@ def fix_common_xml_issues(content):
     
     return content
 
-def check_and_fix_opml(file_path):
+def check_and_fix_opml(file_path, log=print):
     """Check if an OPML file is valid XML and fix common issues if not."""
+    return _check_and_fix_opml(file_path, log) is not None
+
+def _check_and_fix_opml(file_path, log):
+    """Validate and repair one OPML file, returning its parsed root element or None if it could not be fixed."""
     try:
         # Read file content with appropriate encoding
         content, encoding = read_file_content(file_path)
+        original_content = content
         
         # Try parsing the original content
         try:
-            ET.fromstring(content)
-            print(f"✓ {file_path} is valid XML")
-            return True
+            root = ET.fromstring(content)
+            log(f"✓ {file_path} is valid XML")
+            return root
         except Exception as e:
             original_error = str(e)
-            print(f"✗ {file_path} has XML issues: {original_error}")
+            log(f"✗ {file_path} has XML issues: {original_error}")
             
             # First, fix the XML structure (remove junk after document element)
             content = fix_xml_structure(content)
@@ -73,32 +93,32 @@ def check_and_fix_opml(file_path):
             
             # Try parsing the fixed content
             try:
-                ET.fromstring(content)
-                print(f"  ↳ Successfully fixed issues in {file_path}")
+                root = ET.fromstring(content)
+                log(f"  ↳ Successfully fixed issues in {file_path}")
                 
                 # Backup the original file
                 backup_path = file_path + ".bak"
                 with open(backup_path, 'w', encoding=encoding) as f:
-                    f.write(content)
-                print(f"  ↳ Original file backed up to {backup_path}")
+                    f.write(original_content)
+                log(f"  ↳ Original file backed up to {backup_path}")
                 
                 # Save the fixed content
                 with open(file_path, 'w', encoding=encoding) as f:
                     f.write(content)
-                print(f"  ↳ Fixed content saved to {file_path}")
-                return True
+                log(f"  ↳ Fixed content saved to {file_path}")
+                return root
             except Exception as e:
-                print(f"  ↳ Could not fix issues automatically: {str(e)}")
+                log(f"  ↳ Could not fix issues automatically: {str(e)}")
                 
                 # Manual examination of the file to help diagnose issues
-                print(f"  ↳ Examining file structure...")
+                log(f"  ↳ Examining file structure...")
                 with open(file_path, 'r', encoding=encoding) as f:
                     lines = f.readlines()
                     
                     # Check first few lines
                     if len(lines) > 0:
                         first_line = lines[0].strip()
-                        print(f"  ↳ First line: {first_line[:60]}...")
+                        log(f"  ↳ First line: {first_line[:60]}...")
                     
                     # Try to identify XML declaration and root element
                     xml_decl = None
@@ -110,19 +130,19 @@ def check_and_fix_opml(file_path):
                             root_start = (i, line.strip())
                     
                     if xml_decl:
-                        print(f"  ↳ XML declaration found at line {xml_decl[0]+1}: {xml_decl[1]}")
+                        log(f"  ↳ XML declaration found at line {xml_decl[0]+1}: {xml_decl[1]}")
                     else:
-                        print("  ↳ No XML declaration found")
+                        log("  ↳ No XML declaration found")
                         
                     if root_start:
-                        print(f"  ↳ Root element starts at line {root_start[0]+1}: {root_start[1]}")
+                        log(f"  ↳ Root element starts at line {root_start[0]+1}: {root_start[1]}")
                     else:
-                        print("  ↳ No root element found")
+                        log("  ↳ No root element found")
                 
                 # Try an alternative approach for severe cases
                 try:
                     # Create minimal valid OPML structure
-                    print("  ↳ Attempting to extract and rebuild OPML structure...")
+                    log("  ↳ Attempting to extract and rebuild OPML structure...")
                     
                     # Extract outline elements
                     outline_matches = re.findall(r'<outline[^>]*>.*?</outline>|<outline[^>]*?/>', content, re.DOTALL)
@@ -135,55 +155,152 @@ def check_and_fix_opml(file_path):
                         
                         for match in outline_matches:
                             # Fix common issues in outline elements
-                            fixed_match = re.sub(r'&(?!(amp|lt|gt|apos|quot|#\d+|#x[0-9a-fA-F]+);)', '&amp;', match)
+                            fixed_match = UNESCAPED_AMPERSAND_RE.sub('&amp;', match)
                             new_content += fixed_match + '\n'
                         
                         new_content += '</body>\n</opml>'
                         
                         # Try parsing the reconstructed content
                         try:
-                            ET.fromstring(new_content)
-                            print(f"  ↳ Successfully reconstructed OPML for {file_path}")
+                            root = ET.fromstring(new_content)
+                            log(f"  ↳ Successfully reconstructed OPML for {file_path}")
                             
                             # Save the reconstructed content
                             reconstructed_path = file_path + ".reconstructed"
                             with open(reconstructed_path, 'w', encoding='utf-8') as f:
                                 f.write(new_content)
-                            print(f"  ↳ Reconstructed OPML saved to {reconstructed_path}")
+                            log(f"  ↳ Reconstructed OPML saved to {reconstructed_path}")
                             
                             # Optionally replace the original
                             with open(file_path, 'w', encoding='utf-8') as f:
                                 f.write(new_content)
-                            print(f"  ↳ Original file replaced with reconstructed OPML")
-                            return True
+                            log(f"  ↳ Original file replaced with reconstructed OPML")
+                            return root
                         except Exception as e:
-                            print(f"  ↳ Reconstruction failed: {str(e)}")
+                            log(f"  ↳ Reconstruction failed: {str(e)}")
                     else:
-                        print("  ↳ Could not find outline elements for reconstruction")
+                        log("  ↳ Could not find outline elements for reconstruction")
                 except Exception as e:
-                    print(f"  ↳ Advanced repair attempt failed: {str(e)}")
+                    log(f"  ↳ Advanced repair attempt failed: {str(e)}")
                 
-                return False
+                return None
             
     except Exception as e:
-        print(f"Error processing {file_path}: {str(e)}")
-        return False
+        log(f"Error processing {file_path}: {str(e)}")
+        return None
 
-def process_directory(directory):
-    """Process all OPML files in a directory."""
-    fixed_count = 0
-    error_count = 0
-    
+def list_opml_files(directory):
+    """List the OPML files under a directory, skipping backups and reconstructions."""
+    paths = []
     for root, _, files in os.walk(directory):
         for file in files:
             if file.endswith('.opml') and not file.endswith('.bak') and not file.endswith('.reconstructed'):
-                file_path = os.path.join(root, file)
-                if check_and_fix_opml(file_path):
-                    fixed_count += 1
-                else:
-                    error_count += 1
-    
-    print(f"\nProcessing complete: {fixed_count} files fixed, {error_count} files with remaining issues")
+                paths.append(os.path.normpath(os.path.join(root, file)))
+    return sorted(paths)
+
+def file_hash(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def extract_feeds_by_regex(file_path):
+    """Feed URLs of a file that still does not parse, found the way the app finds them."""
+    content, _ = read_file_content(file_path)
+    return XML_URL_RE.findall(content)
+
+def repair_file(file_path):
+    """Check and fix one OPML file and collect its feeds.
+
+    Runs in a worker process, so log lines are returned instead of printed. The hash is
+    taken after any repair, so the next incremental run sees the file as unchanged.
+    Feeds of files that cannot be repaired are extracted by regex, as the app does.
+    """
+    messages = []
+    root = _check_and_fix_opml(file_path, messages.append)
+    if root is not None:
+        feeds = [outline.attrib['xmlUrl'] for outline in root.iter('outline') if outline.attrib.get('xmlUrl')]
+    else:
+        feeds = extract_feeds_by_regex(file_path)
+        messages.append(f"  ↳ Extracted {len(feeds)} feed URLs by regex from {file_path}")
+    return {"ok": root is not None, "hash": file_hash(file_path), "feeds": feeds, "messages": messages}
+
+def process_directory(directory, manifest=None, jobs=None):
+    """Process all OPML files in a directory.
+
+    Files whose content hash matches their manifest entry are skipped and keep their
+    previous result; the rest are checked in a process pool of `jobs` workers (one per
+    CPU by default). The manifest is updated in place and returned.
+    """
+    manifest = {} if manifest is None else manifest
+    fixed_count = 0
+    error_count = 0
+    skipped_count = 0
+    pending = []
+
+    for file_path in list_opml_files(directory):
+        entry = manifest.get(file_path)
+        if entry and entry['hash'] == file_hash(file_path):
+            skipped_count += 1
+            if entry['ok']:
+                fixed_count += 1
+            else:
+                error_count += 1
+                # Manifests from before the regex fallback recorded no feeds for these files
+                entry['feeds'] = entry['feeds'] or extract_feeds_by_regex(file_path)
+        else:
+            pending.append(file_path)
+
+    if jobs == 1 or len(pending) <= 1:
+        results = [repair_file(file_path) for file_path in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(repair_file, pending))
+
+    for file_path, result in zip(pending, results):
+        for message in result.pop('messages'):
+            print(message)
+        manifest[file_path] = result
+        if result['ok']:
+            fixed_count += 1
+        else:
+            error_count += 1
+
+    print(f"\nProcessing complete: {fixed_count} files fixed, {error_count} files with remaining issues, {skipped_count} unchanged files skipped")
+    return manifest
+
+def load_manifest(base_dir):
+    manifest_path = os.path.join(base_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
+
+def write_if_changed(path, content):
+    """Write content to path unless the file already holds exactly that content."""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+def write_catalog(base_dir, manifest):
+    """Write the compiled feed catalog: each OPML file, relative to base_dir, mapped to its feed URLs.
+
+    Files that could not be repaired are included with their regex-extracted feeds, so the
+    catalog lists exactly what the app fetches.
+    """
+    catalog = {
+        os.path.relpath(file_path, base_dir).replace(os.sep, '/'): entry['feeds']
+        for file_path, entry in sorted(manifest.items())
+    }
+    catalog_path = os.path.join(base_dir, CATALOG_NAME)
+    if write_if_changed(catalog_path, json.dumps(catalog, indent=1, ensure_ascii=False)):
+        print(f"Feed catalog written to {catalog_path} ({sum(len(feeds) for feeds in catalog.values())} feeds)")
 
 def create_sample_opml(output_path):
     """Create a sample valid OPML file for reference."""
@@ -206,13 +323,49 @@ def create_sample_opml(output_path):
 </opml>"""
     
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(sample_opml)
-    print(f"Created sample valid OPML file at {output_path}")
+    if write_if_changed(output_path, sample_opml):
+        print(f"Created sample valid OPML file at {output_path}")
+
+def map_feeds_to_opml(base_dir):
+    """Map each feed URL to the OPML files that reference it."""
+    feed_files = {}
+    for root, _, files in os.walk(base_dir):
+        for file in files:
+            if not file.endswith('.opml'):
+                continue
+            content, _ = read_file_content(os.path.join(root, file))
+            for url in re.findall(r'xmlUrl="([^"]+)"', content):
+                feed_files.setdefault(saxutils.unescape(url), []).append(file)
+    return feed_files
+
+def print_feed_health(health_path, base_dir, limit=20):
+    """Print the worst offending feeds recorded by the feed health tracker."""
+    if not os.path.exists(health_path):
+        print(f"No feed health file at {health_path}; it is written by the API on shutdown and every few minutes")
+        return
+
+    from feed_health import FeedHealthTracker
+    tracker = FeedHealthTracker(path=health_path)
+    feed_files = map_feeds_to_opml(base_dir)
+
+    print(f"Worst {min(limit, len(tracker.feeds))} of {len(tracker.feeds)} tracked feeds:\n")
+    for item in tracker.report(limit):
+        latency = f"{item['latency_ewma']:.2f}s" if item['latency_ewma'] is not None else "-"
+        last_success = datetime.fromtimestamp(item['last_success']).strftime('%Y-%m-%d %H:%M') if item['last_success'] else "never"
+        print(f"{item['state']:<12} errors {item['error_rate']:>4.0%}  latency {latency:>7}  last ok {last_success}  {item['url']}")
+        if item['last_error']:
+            print(f"  ↳ Last error: {item['last_error'][:100]}")
+        files = feed_files.get(item['url'])
+        if files:
+            print(f"  ↳ Listed in: {', '.join(sorted(set(files)))}")
+
+def repair_all(base_dir, jobs=None, full=False):
+    """Create the reference sample and check and fix every country and interest OPML file.
+
+    Unless full is set, files unchanged since the last run are skipped using the manifest.
+    """
+    manifest = {} if full else load_manifest(base_dir)
 
-if __name__ == "__main__":
-    base_dir = "opml"  # Change this to your OPML directory
-    
     # Create a sample valid OPML file for reference
     create_sample_opml(os.path.join(base_dir, "sample_valid.opml"))
     
@@ -220,10 +373,32 @@ if __name__ == "__main__":
     countries_dir = os.path.join(base_dir, "countries_without_category")
     if os.path.exists(countries_dir):
         print(f"\nProcessing country OPML files in {countries_dir}...\n")
-        process_directory(countries_dir)
+        process_directory(countries_dir, manifest, jobs)
     
     # Process interests directory
     interests_dir = os.path.join(base_dir, "interests_without_category")
     if os.path.exists(interests_dir):
         print(f"\nProcessing interest OPML files in {interests_dir}...\n")
-        process_directory(interests_dir)
\ No newline at end of file
+        process_directory(interests_dir, manifest, jobs)
+
+    # Forget files that were deleted since the last run
+    manifest = {file_path: entry for file_path, entry in manifest.items() if os.path.exists(file_path)}
+    write_if_changed(os.path.join(base_dir, MANIFEST_NAME), json.dumps(manifest, indent=1, sort_keys=True))
+    write_catalog(base_dir, manifest)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OPML maintenance utilities")
+    parser.add_argument("--base-dir", default="opml", help="OPML directory")
+    subparsers = parser.add_subparsers(dest="command")
+    repair_parser = subparsers.add_parser("repair", help="check and fix all OPML files (default)")
+    repair_parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    repair_parser.add_argument("--full", action="store_true", help="re-check every file, ignoring the manifest")
+    health_parser = subparsers.add_parser("health", help="list the worst offending feeds")
+    health_parser.add_argument("--path", default=os.environ.get("FEED_HEALTH_PATH", "feed_health.json"))
+    health_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "health":
+        print_feed_health(args.path, args.base_dir, args.limit)
+    else:
+        repair_all(args.base_dir, getattr(args, "jobs", None), getattr(args, "full", False))
\ No newline at end of file
@@ -0,0 +1,72 @@
+# pagination.py
+import base64
+import binascii
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class InvalidCursor(Exception):
+    """The cursor no longer points into a live snapshot (expired or replaced)."""
+
+
+class MalformedCursor(InvalidCursor):
+    """The cursor was never issued by encode_cursor."""
+
+
+def encode_cursor(snapshot_id: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{snapshot_id}.{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        snapshot_id, offset = raw.rsplit(".", 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise MalformedCursor("Malformed cursor")
+    if offset < 0:
+        raise MalformedCursor("Malformed cursor")
+    return snapshot_id, offset
+
+
+class SnapshotStore:
+    """Per-user snapshots of ranked candidates, so "load more" pages never rerun the pipeline.
+
+    Each user holds one snapshot at a time: the articles that ranked below the first page,
+    in score order. Loading the first page again replaces it, which invalidates older
+    cursors. Snapshots expire after ttl seconds and the least recently used are dropped
+    beyond max_users.
+    """
+
+    def __init__(self, ttl: float = 1800, max_users: int = 10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._snapshots = OrderedDict()
+
+    def create(self, uid: str, candidates: List[Dict]) -> Optional[str]:
+        """Store candidates for uid and return the cursor for their first page, if there is one."""
+        snapshot_id = secrets.token_urlsafe(8)
+        self._snapshots[uid] = {
+            "id": snapshot_id,
+            "candidates": candidates,
+            "expiry": time.monotonic() + self.ttl,
+        }
+        self._snapshots.move_to_end(uid)
+        while len(self._snapshots) > self.max_users:
+            self._snapshots.popitem(last=False)
+        return encode_cursor(snapshot_id, 0) if candidates else None
+
+    def page(self, uid: str, cursor: str, size: int) -> Tuple[List[Dict], Optional[str]]:
+        """Return the page at cursor and the cursor after it (None once the snapshot is exhausted)."""
+        snapshot_id, offset = decode_cursor(cursor)
+        snapshot = self._snapshots.get(uid)
+        if snapshot is None or snapshot["id"] != snapshot_id or time.monotonic() >= snapshot["expiry"]:
+            raise InvalidCursor("Cursor has expired")
+        self._snapshots.move_to_end(uid)
+
+        candidates = snapshot["candidates"]
+        end = offset + size
+        next_cursor = encode_cursor(snapshot_id, end) if end < len(candidates) else None
+        return candidates[offset:end], next_cursor
@@ -1,87 +1,225 @@
-from feed_parser import FeedParser
+from feed_parser import FeedParser, import_parsers
 from feed_manager import FeedManager
 import os
 from datetime import datetime, timedelta
 import asyncio
-from sklearn.feature_extraction.text import TfidfVectorizer
-import nltk
-from nltk.corpus import stopwords
+import numpy as np
+import re
 import string
-from collections import defaultdict
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from metrics import record_cache, span
+from scoring import CorpusArrays, ScorerPool, SharedCorpus, rank_profile
+
+logger = logging.getLogger(__name__)
+
+# NLTK's English stopword list, bundled so a cold start never has to download it
+STOPWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "stopwords_english.txt")
+
+# Same tokenization scikit-learn's TfidfVectorizer uses to decide which documents contain a term
+IDF_TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+# Profiles ranked per hand-off to a worker thread when there is no scorer pool
+RANK_CHUNK_SIZE = 16
+
+
+def load_stopwords(path: str = STOPWORDS_PATH) -> set:
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+TOPIC_KEYWORDS = {
+    'Technology': ['tech', 'software', 'digital', 'ai', 'computer', 'app', 'cyber', 'innovation', 'programming', 'gadget', 'electronics', 'internet'],
+    'Science': ['research', 'study', 'scientist', 'discovery', 'lab', 'physics', 'chemistry', 'biology', 'astronomy', 'experiment', 'scientific'],
+    'Business': ['market', 'company', 'startup', 'finance', 'industry', 'trade', 'economy', 'investment', 'business', 'entrepreneur', 'commerce'],
+    'Arts': ['artist', 'exhibition', 'museum', 'gallery', 'painting', 'sculpture', 'art', 'design', 'creative', 'artwork', 'culture'],
+    'Politics': ['government', 'policy', 'election', 'congress', 'political', 'vote', 'democracy', 'president', 'legislation', 'campaign', 'civic'],
+    'Food': ['recipe', 'restaurant', 'cuisine', 'cooking', 'chef', 'meal', 'food', 'dining', 'ingredients', 'gourmet', 'culinary'],
+    'Fashion': ['style', 'design', 'fashion', 'trend', 'collection', 'wear', 'clothing', 'apparel', 'luxury', 'couture', 'stylish'],
+    'Movies': ['film', 'movie', 'cinema', 'director', 'actor', 'hollywood', 'screen', 'drama', 'comedy', 'thriller', 'animation'],
+    'Sports': ['game', 'player', 'team', 'tournament', 'championship', 'athlete', 'sport', 'football', 'basketball', 'soccer', 'tennis'],
+    'Health': ['medical', 'health', 'wellness', 'therapy', 'treatment', 'doctor', 'disease', 'medicine', 'healthcare', 'fitness', 'nutrition'],
+    'Music': ['song', 'album', 'artist', 'band', 'concert', 'musical', 'music', 'genre', 'melody', 'rhythm', 'lyrics'],
+    'Gaming': ['game', 'gaming', 'player', 'console', 'esports', 'developer', 'videogame', 'pc', 'playstation', 'xbox', 'nintendo'],
+    'Environment': ['climate', 'environmental', 'sustainable', 'energy', 'eco', 'nature', 'pollution', 'conservation', 'planet', 'ecology', 'green'],
+    'Travel': ['destination', 'tourism', 'travel', 'hotel', 'vacation', 'tour', 'adventure', 'explore', 'holiday', 'journey', 'trip'],
+    'Education': ['school', 'university', 'learning', 'student', 'teacher', 'course', 'education', 'knowledge', 'study', 'academic', 'college']
+}
+
+
+class ArticleCorpus:
+    """Valid articles from a set of feeds, scored once and shared by every profile reading them."""
+
+    def __init__(self, articles: List[Dict], sources: List[str], scores: np.ndarray, topic_hits: np.ndarray,
+                 vocabulary: Dict[str, int], term_rows: np.ndarray, term_ids: np.ndarray):
+        self.articles = articles        # article dicts as returned by FeedParser
+        self.sources = sources          # feed URL each article came from
+        self.scores = scores            # (n,) keyword TF-IDF relevance plus freshness bonus
+        self.topic_hits = topic_hits    # (n, len(TOPIC_KEYWORDS)) keywords of each topic found in the text
+        # Sparse article x term presence matrix in coordinate form: article term_rows[j] contains
+        # vocabulary term term_ids[j]. Used to score articles against per-user term weights.
+        self.vocabulary = vocabulary
+        self.term_rows = term_rows
+        self.term_ids = term_ids
+        self.feed_index = {url: f for f, url in enumerate(dict.fromkeys(sources))}
+        self.feed_ids = np.array([self.feed_index[url] for url in sources], dtype=np.intp)
+        self._shared = None
+
+    def __len__(self):
+        return len(self.articles)
+
+    def arrays(self) -> CorpusArrays:
+        return CorpusArrays(self.scores, self.topic_hits, self.term_rows, self.term_ids, self.feed_ids,
+                            len(self.vocabulary), len(self.feed_index))
+
+    def shared(self) -> SharedCorpus:
+        """The corpus arrays in shared memory, published on first use by a scorer pool."""
+        if self._shared is None:
+            self._shared = SharedCorpus(self.arrays())
+        return self._shared
 
-nltk.download('stopwords', quiet=True) # Download stopwords if you haven't already
 
 class TopicBasedRecommender:
-    def __init__(self):
+    def __init__(self, feed_manager: Optional[FeedManager] = None, result_cache_ttl: timedelta = timedelta(minutes=15),
+                 scorer_processes: Optional[int] = None, result_cache_size: int = 1000,
+                 warm_cache_ttl: timedelta = timedelta(hours=8), warm_cache_size: int = 2000):
         self.feed_parser = FeedParser()
-        self.stop_words = set(stopwords.words('english'))
+        self.feed_manager = feed_manager or FeedManager()
+        self.stop_words = load_stopwords()
         self.punctuation = string.punctuation
+        self._punctuation_table = str.maketrans('', '', string.punctuation)
+
+        # Keyword vocabulary shared by every topic. A keyword listed under two topics
+        # ('design', 'game', ...) counts once per topic, as it always has.
+        self.topics = list(TOPIC_KEYWORDS)
+        topic_keywords = {topic: [self.preprocess_text(kw) for kw in kws] for topic, kws in TOPIC_KEYWORDS.items()}
+        self.keywords = sorted({kw for kws in topic_keywords.values() for kw in kws})
+        keyword_index = {kw: i for i, kw in enumerate(self.keywords)}
+        self.topic_matrix = np.zeros((len(self.keywords), len(self.topics)))
+        for t, topic in enumerate(self.topics):
+            for kw in topic_keywords[topic]:
+                self.topic_matrix[keyword_index[kw], t] += 1
+        self.keyword_weights = self.topic_matrix.sum(axis=1)
+        self.topic_index = {topic: t for t, topic in enumerate(self.topics)}
+
+        # Ranked results by profile, least recently used first; entries pin their articles in memory
+        self.result_cache = OrderedDict()
+        self.result_cache_ttl = result_cache_ttl
+        self.result_cache_size = result_cache_size
+        # Results precomputed off-peak by warm_result_cache, kept apart so they outlive live traffic
+        self.warm_cache = OrderedDict()
+        self.warm_cache_ttl = warm_cache_ttl
+        self.warm_cache_size = warm_cache_size
+        # Scored corpora by feed set, so a personalized rerank does not rescore every article
+        self.corpus_cache = {}
+        self.personalization_weight = 1.0
+        # Diversity of the first page: relevance vs. novelty trade-off, and picks allowed per feed
+        self.mmr_lambda = 0.7
+        self.max_per_source = 2
+
+        # Ranking runs in this many worker processes against shared-memory corpora; 0 ranks in-process
+        if scorer_processes is None:
+            scorer_processes = int(os.environ.get("SCORER_PROCESSES", "0"))
+        self.scorer_pool = ScorerPool(scorer_processes) if scorer_processes > 0 else None
+
+    def warm_up(self):
+        """Import the parser libraries, parse every OPML file and run the scoring path once."""
+        import_parsers()
+        feeds = self.feed_manager.preload()
+        self.build_corpus([{'title': 'warm up', 'description': 'warm up', 'published': None}], [''])
+        logger.info("Warm-up complete: %d OPML feeds loaded", feeds)
 
     def preprocess_text(self, text):
         text = text.lower()
-        text = ''.join([char for char in text if char not in self.punctuation]) # Remove punctuation
+        text = text.translate(self._punctuation_table) # Remove punctuation
         tokens = text.split()
         tokens = [token for token in tokens if token not in self.stop_words] # Remove stopwords
-        return " ".join(tokens) # Return as string for TfidfVectorizer
-
-    def calculate_tfidf_score(self, article_text, interest_keywords, idf_values): # idf_values passed in
-        article_text = self.preprocess_text(article_text)
-        score = 0
-        for interest, keywords in interest_keywords.items(): # interest_keywords is now a dict
-            for keyword in keywords:
-                keyword = self.preprocess_text(keyword) # preprocess keywords too for matching
-                if keyword in article_text:
-                    tf = article_text.split().count(keyword) / len(article_text.split()) if article_text.split() else 0 # TF calculation
-                    idf = idf_values.get(keyword, 0) # Get pre-calculated IDF, default to 0 if keyword not in IDF vocab
-                    score += tf * idf * 2 # TF-IDF score, doubled for interest relevance
-        return score
-
-
-    def calculate_topic_score(self, text, interests, published_date_str, corpus_texts): # corpus_texts added
-        processed_texts = [self.preprocess_text(doc) for doc in corpus_texts] # preprocess corpus
-        vectorizer = TfidfVectorizer()
-        vectorizer.fit(processed_texts) # Fit on the corpus to learn IDF values
-        idf_values_dict = dict(zip(vectorizer.get_feature_names_out(), vectorizer.idf_)) # create dict for IDF lookup
-
-
-        topic_keywords_tfidf = { # Use processed keywords for TF-IDF
-            'Technology': [self.preprocess_text(kw) for kw in ['tech', 'software', 'digital', 'ai', 'computer', 'app', 'cyber', 'innovation', 'programming', 'gadget', 'electronics', 'internet']],
-            'Science': [self.preprocess_text(kw) for kw in ['research', 'study', 'scientist', 'discovery', 'lab', 'physics', 'chemistry', 'biology', 'astronomy', 'experiment', 'scientific']],
-            'Business': [self.preprocess_text(kw) for kw in ['market', 'company', 'startup', 'finance', 'industry', 'trade', 'economy', 'investment', 'business', 'entrepreneur', 'commerce']],
-            'Arts': [self.preprocess_text(kw) for kw in ['artist', 'exhibition', 'museum', 'gallery', 'painting', 'sculpture', 'art', 'design', 'creative', 'artwork', 'culture']],
-            'Politics': [self.preprocess_text(kw) for kw in ['government', 'policy', 'election', 'congress', 'political', 'vote', 'democracy', 'president', 'legislation', 'campaign', 'civic']],
-            'Food': [self.preprocess_text(kw) for kw in ['recipe', 'restaurant', 'cuisine', 'cooking', 'chef', 'meal', 'food', 'dining', 'ingredients', 'gourmet', 'culinary']],
-            'Fashion': [self.preprocess_text(kw) for kw in ['style', 'design', 'fashion', 'trend', 'collection', 'wear', 'clothing', 'apparel', 'luxury', 'couture', 'stylish']],
-            'Movies': [self.preprocess_text(kw) for kw in ['film', 'movie', 'cinema', 'director', 'actor', 'hollywood', 'screen', 'drama', 'comedy', 'thriller', 'animation']],
-            'Sports': [self.preprocess_text(kw) for kw in ['game', 'player', 'team', 'tournament', 'championship', 'athlete', 'sport', 'football', 'basketball', 'soccer', 'tennis']],
-            'Health': [self.preprocess_text(kw) for kw in ['medical', 'health', 'wellness', 'therapy', 'treatment', 'doctor', 'disease', 'medicine', 'healthcare', 'fitness', 'nutrition']],
-            'Music': [self.preprocess_text(kw) for kw in ['song', 'album', 'artist', 'band', 'concert', 'musical', 'music', 'genre', 'melody', 'rhythm', 'lyrics']],
-            'Gaming': [self.preprocess_text(kw) for kw in ['game', 'gaming', 'player', 'console', 'esports', 'developer', 'videogame', 'pc', 'playstation', 'xbox', 'nintendo']],
-            'Environment': [self.preprocess_text(kw) for kw in ['climate', 'environmental', 'sustainable', 'energy', 'eco', 'nature', 'pollution', 'conservation', 'planet', 'ecology', 'green']],
-            'Travel': [self.preprocess_text(kw) for kw in ['destination', 'tourism', 'travel', 'hotel', 'vacation', 'tour', 'adventure', 'explore', 'holiday', 'journey', 'trip']],
-            'Education': [self.preprocess_text(kw) for kw in ['school', 'university', 'learning', 'student', 'teacher', 'course', 'education', 'knowledge', 'study', 'academic', 'college']]
-        }
-
-
-        article_score = self.calculate_tfidf_score(text, topic_keywords_tfidf, idf_values_dict)
-
-
-        if published_date_str: # Freshness bonus remains the same
-            try:
-                published_date = datetime.fromisoformat(published_date_str.replace('Z', '+00:00'))
-                now = datetime.now()
-                age_days = (now - published_date).days
-                freshness_bonus = 0
-                if age_days <= 7:
-                    freshness_bonus = 5
-                elif age_days <= 14:
-                    freshness_bonus = 3
-                elif age_days <= 30:
-                    freshness_bonus = 1
-                article_score += freshness_bonus
-            except (ValueError, AttributeError, TypeError):
-                pass
-        return article_score
+        return " ".join(tokens)
+
+    def tokenize(self, text: str) -> List[str]:
+        return IDF_TOKEN_RE.findall(self.preprocess_text(text))
+
+    def freshness_bonus(self, published_date_str):
+        if not published_date_str:
+            return 0
+        try:
+            published_date = datetime.fromisoformat(published_date_str.replace('Z', '+00:00'))
+            age_days = (datetime.now() - published_date).days
+        except (ValueError, AttributeError, TypeError):
+            return 0
+        if age_days <= 7:
+            return 5
+        elif age_days <= 14:
+            return 3
+        elif age_days <= 30:
+            return 1
+        return 0
+
+    def build_corpus(self, articles: List[Dict], sources: List[str]) -> ArticleCorpus:
+        """Score every article once.
+
+        The relevance score is the keyword TF-IDF sum across all topics (IDF learned from
+        this corpus) plus the freshness bonus; it does not depend on who is reading, so a
+        corpus can be shared by many profiles. topic_hits counts, per topic, how many of
+        its keywords occur in the text and drives each profile's interest assignment.
+        """
+        n = len(articles)
+        counts = np.zeros((n, len(self.keywords)))
+        present = np.zeros((n, len(self.keywords)))
+        lengths = np.zeros(n)
+        freshness = np.zeros(n)
+        document_frequency = defaultdict(int)
+        vocabulary = {}
+        term_rows = []
+        term_ids = []
+
+        for i, article in enumerate(articles):
+            text = self.preprocess_text(f"{article['title']} {article['description']}")
+            for token in set(IDF_TOKEN_RE.findall(text)):
+                document_frequency[token] += 1
+                term_rows.append(i)
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+            tokens = text.split()
+            lengths[i] = len(tokens)
+            token_counts = defaultdict(int)
+            for token in tokens:
+                token_counts[token] += 1
+            for k, keyword in enumerate(self.keywords):
+                if keyword in text:
+                    present[i, k] = 1
+                    counts[i, k] = token_counts.get(keyword, 0)
+            freshness[i] = self.freshness_bonus(article.get('published'))
+
+        # Smoothed IDF as computed by scikit-learn's TfidfVectorizer. A keyword that never
+        # occurs as a token has no term frequency either, so its IDF never contributes.
+        df = np.array([document_frequency.get(keyword, 0) for keyword in self.keywords])
+        idf = np.log((1 + n) / (1 + df)) + 1
+        tf = counts / np.maximum(lengths, 1)[:, None]
+        scores = tf @ (idf * self.keyword_weights * 2) + freshness
+
+        return ArticleCorpus(
+            articles, sources, scores, present @ self.topic_matrix,
+            vocabulary, np.array(term_rows, dtype=np.intp), np.array(term_ids, dtype=np.intp)
+        )
+
+    def personal_terms(self, corpus: ArticleCorpus, term_weights: Dict[str, float]):
+        """A user's term weights as (corpus term ids, weights scaled to a maximum of 1), or None
+        if none of the terms occur in the corpus.
+
+        The scaling means personalization_weight bounds how far a single strongly weighted
+        term can move an article.
+        """
+        top = max(term_weights.values(), default=0)
+        if top <= 0:
+            return None
+        matched = [(corpus.vocabulary[term], weight / top) for term, weight in term_weights.items()
+                   if term in corpus.vocabulary]
+        if not matched:
+            return None
+        term_ids, weights = zip(*matched)
+        return np.array(term_ids, dtype=np.intp), np.array(weights)
 
     def is_within_date_range(self, article_date_str):
         try:
@@ -104,275 +242,236 @@ class TopicBasedRecommender:
         if not article.get('published'):
             return False
         return self.is_within_date_range(article['published'])
-    
-    def get_top_interests_scores(self, article_text, user_interests):
-        # Calculate score for each interest and return top matches
-        interest_scores = {}
-        
-        # Process the article text once
-        processed_text = self.preprocess_text(article_text)
-        
-        topic_keywords = {
-            'Technology': ['tech', 'software', 'digital', 'ai', 'computer', 'app', 'cyber', 'innovation', 'programming', 'gadget', 'electronics', 'internet'],
-            'Science': ['research', 'study', 'scientist', 'discovery', 'lab', 'physics', 'chemistry', 'biology', 'astronomy', 'experiment', 'scientific'],
-            'Business': ['market', 'company', 'startup', 'finance', 'industry', 'trade', 'economy', 'investment', 'business', 'entrepreneur', 'commerce'],
-            'Arts': ['artist', 'exhibition', 'museum', 'gallery', 'painting', 'sculpture', 'art', 'design', 'creative', 'artwork', 'culture'],
-            'Politics': ['government', 'policy', 'election', 'congress', 'political', 'vote', 'democracy', 'president', 'legislation', 'campaign', 'civic'],
-            'Food': ['recipe', 'restaurant', 'cuisine', 'cooking', 'chef', 'meal', 'food', 'dining', 'ingredients', 'gourmet', 'culinary'],
-            'Fashion': ['style', 'design', 'fashion', 'trend', 'collection', 'wear', 'clothing', 'apparel', 'luxury', 'couture', 'stylish'],
-            'Movies': ['film', 'movie', 'cinema', 'director', 'actor', 'hollywood', 'screen', 'drama', 'comedy', 'thriller', 'animation'],
-            'Sports': ['game', 'player', 'team', 'tournament', 'championship', 'athlete', 'sport', 'football', 'basketball', 'soccer', 'tennis'],
-            'Health': ['medical', 'health', 'wellness', 'therapy', 'treatment', 'doctor', 'disease', 'medicine', 'healthcare', 'fitness', 'nutrition'],
-            'Music': ['song', 'album', 'artist', 'band', 'concert', 'musical', 'music', 'genre', 'melody', 'rhythm', 'lyrics'],
-            'Gaming': ['game', 'gaming', 'player', 'console', 'esports', 'developer', 'videogame', 'pc', 'playstation', 'xbox', 'nintendo'],
-            'Environment': ['climate', 'environmental', 'sustainable', 'energy', 'eco', 'nature', 'pollution', 'conservation', 'planet', 'ecology', 'green'],
-            'Travel': ['destination', 'tourism', 'travel', 'hotel', 'vacation', 'tour', 'adventure', 'explore', 'holiday', 'journey', 'trip'],
-            'Education': ['school', 'university', 'learning', 'student', 'teacher', 'course', 'education', 'knowledge', 'study', 'academic', 'college']
-        }
-
-        # Calculate score for each interest
-        for interest in user_interests:
-            if interest in topic_keywords:
-                keywords = topic_keywords[interest]
-                processed_keywords = [self.preprocess_text(kw) for kw in keywords]
-                
-                score = 0
-                for keyword in processed_keywords:
-                    if keyword in processed_text:
-                        score += 1
-                
-                interest_scores[interest] = score
-        
-        # Return the interest with the highest score
-        if interest_scores:
-            return max(interest_scores.items(), key=lambda x: x[1])[0]
-        return user_interests[0] if user_interests else "General"
-
-    from collections import defaultdict
-
-    async def get_recommendations(self, user_profile: str, feed_urls: list, user_interests: list, user_nationality: str):
-        print("🔍 Starting recommendation process")
-        print(f"🧠 User interests: {user_interests}")
-        print(f"🌐 Feed URLs: {len(feed_urls)} total")
-        print(f"🌍 User nationality: {user_nationality}")
-        
-        # Debug: Print the actual feed URLs
-        print(f"📥 Received feed_urls: {feed_urls[:5]}...")  # Print first 5 URLs
-        
-        # Let's use the FeedManager to identify country feeds
-        feed_manager = FeedManager()
-        
-        # Get country-specific feeds properly based on nationality
-        potential_country_feed_urls = feed_manager._load_opml_cached(
-            os.path.join(feed_manager.base_dir, "countries_without_category", f"{user_nationality}.opml")
-        )
-        
-        # Debug: Print what we loaded from the OPML file
-        print(f"🔍 Country feeds from OPML file: {len(potential_country_feed_urls)} total")
-        print(f"📝 Sample country OPML URLs: {potential_country_feed_urls[:2]}...")  # Print first 2
-        
-        # If country file doesn't exist, try fallbacks
-        if not potential_country_feed_urls:
-            print(f"⚠️ No OPML file found for {user_nationality}, trying fallbacks...")
-            for fallback in feed_manager.country_fallbacks:
-                potential_country_feed_urls = feed_manager._load_opml_cached(
-                    os.path.join(feed_manager.base_dir, "countries_without_category", fallback)
-                )
-                if potential_country_feed_urls:
-                    print(f"✅ Using {fallback} as fallback")
-                    break
-        
-        # Debug: Print the matching process
+
+    def split_feeds(self, feed_urls: list, user_nationality: str):
+        """Separate a user's feeds into country feeds and interest feeds."""
+        feed_manager = self.feed_manager
+
+        # Country feeds for the nationality in any spelling, with regional and default fallbacks applied
+        potential_country_feed_urls = set(feed_manager.get_country_feeds(user_nationality))
+        logger.debug("Country feeds from OPML file: %d total", len(potential_country_feed_urls))
+
         country_feed_urls = []
         for url in feed_urls:
             if url in potential_country_feed_urls:
                 country_feed_urls.append(url)
-        
-        print(f"🔍 Matched {len(country_feed_urls)} country feeds from {len(feed_urls)} input feeds")
-        
+
+        logger.debug("Matched %d country feeds from %d input feeds", len(country_feed_urls), len(feed_urls))
+
         # If no direct matches found, try a different approach
         if not country_feed_urls:
-            print("❌ No direct URL matches found")
+            logger.debug("No direct URL matches found")
             # Check if the issue is with URL formatting (http vs https, trailing slashes, etc.)
-            normalized_potential_urls = [url.lower().strip().rstrip('/') for url in potential_country_feed_urls]
+            normalized_potential_urls = {url.lower().strip().rstrip('/') for url in potential_country_feed_urls}
             normalized_feed_urls = [url.lower().strip().rstrip('/') for url in feed_urls]
-            
+
             for i, normalized_feed_url in enumerate(normalized_feed_urls):
                 if normalized_feed_url in normalized_potential_urls:
                     country_feed_urls.append(feed_urls[i])
-            
-            print(f"🔍 After normalization: Matched {len(country_feed_urls)} country feeds")
-        
+
+            logger.debug("After normalization: matched %d country feeds", len(country_feed_urls))
+
         interest_feed_urls = [url for url in feed_urls if url not in country_feed_urls]
-        
-        print(f"📌 Country feeds identified: {len(country_feed_urls)}")
-        print(f"📌 Interest feeds identified: {len(interest_feed_urls)}")
-        
-        # ... rest of your method remains the same
+
+        logger.debug("Country feeds identified: %d", len(country_feed_urls))
+        logger.debug("Interest feeds identified: %d", len(interest_feed_urls))
 
         if not country_feed_urls and interest_feed_urls:
             country_idx = max(1, len(interest_feed_urls) // 5)
             country_feed_urls = interest_feed_urls[:country_idx]
-            print(f"⚠️ No explicit country feeds — selected top {country_idx} as country fallback")
+            logger.debug("No explicit country feeds, selected top %d as country fallback", country_idx)
+
+        return country_feed_urls, interest_feed_urls
 
-        all_feed_urls = list(set(country_feed_urls + interest_feed_urls))
-        print(f"🧪 Fetching {len(all_feed_urls)} feeds...")
+    async def fetch_corpus(self, feed_urls: list) -> ArticleCorpus:
+        corpus_key = frozenset(feed_urls)
+        cached = self.corpus_cache.get(corpus_key)
+        if cached and datetime.now() < cached['expiry']:
+            record_cache("corpus", hit=True)
+            return cached['corpus']
+        record_cache("corpus", hit=False)
 
-        tasks = [self.feed_parser.parse_feed(url) for url in all_feed_urls]
+        logger.debug("Fetching %d feeds", len(feed_urls))
+
+        tasks = [self.feed_parser.parse_feed(url) for url in feed_urls]
         results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Persist feed health off the event loop; this is a no-op until save_interval has elapsed
+        asyncio.get_running_loop().run_in_executor(None, self.feed_parser.health.maybe_save)
 
         all_articles = []
-        corpus_texts = []
-        article_sources = {}
+        article_sources = []
 
         for i, entries in enumerate(results):
             if isinstance(entries, list):
                 for entry in entries:
                     if self.is_valid_article(entry):
-                        article_url = all_feed_urls[i]
-                        content = f"{entry['title']} {entry['description']}"
-                        corpus_texts.append(content)
                         all_articles.append(entry)
-                        article_sources[id(entry)] = article_url
+                        article_sources.append(feed_urls[i])
             else:
-                print(f"❌ Error fetching feed {all_feed_urls[i]}: {results[i]}")
-
-        print(f"📥 Total valid articles fetched: {len(all_articles)}")
-
-        country_articles = []
-        interest_articles = defaultdict(list)
-
-        for article in all_articles:
-            try:
-                content = f"{article['title']} {article['description']}"
-                score = self.calculate_topic_score(content, user_interests, article.get('published'), corpus_texts)
-                primary_interest = self.get_top_interests_scores(content, user_interests)
-                article_with_score = (article, score)
-
-                if article_sources.get(id(article)) in country_feed_urls:
-                    country_articles.append(article_with_score)
-                else:
-                    interest_articles[primary_interest].append(article_with_score)
-            except Exception as e:
-                print(f"❌ Error scoring article: {e}")
-
-        country_articles.sort(key=lambda x: x[1], reverse=True)
-        country_recommendations = [article for article, _ in country_articles[:3]]
-        print(f"🌍 Top country recommendations: {len(country_recommendations)}")
-
-        if len(country_recommendations) < 3:
-            print("⚠️ Not enough country recommendations, backfilling...")
-            more_needed = 3 - len(country_recommendations)
-            all_interest_articles = [item for sublist in interest_articles.values() for item in sublist]
-            all_interest_articles.sort(key=lambda x: x[1], reverse=True)
-            more_articles = [article for article, _ in all_interest_articles[:more_needed]]
-            country_recommendations.extend(more_articles)
-
-        top_interests = sorted(
-            interest_articles.keys(),
-            key=lambda k: sum(score for _, score in interest_articles[k]),
-            reverse=True
-        )[:3]
-
-        while len(top_interests) < 3 and user_interests:
-            for interest in user_interests:
-                if interest not in top_interests:
-                    top_interests.append(interest)
-                    if len(top_interests) == 3:
-                        break
-
-        default_interests = ["General", "Technology", "News"]
-        for interest in default_interests:
-            if len(top_interests) == 3:
-                break
-            if interest not in top_interests:
-                top_interests.append(interest)
-
-        print(f"🎯 Top 3 interests selected: {top_interests}")
-
-        interest_recommendations = []
-
-        for interest in top_interests[:3]:
-            try:
-                articles = interest_articles.get(interest, [])
-                print(f"[DEBUG] Processing interest '{interest}' with {len(articles)} articles")
-                
-                articles.sort(key=lambda x: x[1], reverse=True)
-                top_articles = [article for article, _ in articles[:3]]
-                print(f"[DEBUG] Selected {len(top_articles)} top articles for '{interest}'")
-
-                if len(top_articles) < 3:
-                    more_needed = 3 - len(top_articles)
-                    print(f"[DEBUG] Need {more_needed} more articles for '{interest}'")
-                    
-                    other_articles = []
-                    for other_interest, other_interest_articles in interest_articles.items():
-                        if other_interest != interest:
-                            other_articles.extend([article for article, _ in other_interest_articles])
-                    
-                    other_articles = list({id(a): a for a in other_articles}.values())  # Deduplicate
-                    print(f"[DEBUG] Found {len(other_articles)} other articles from different interests")
-                    
-                    other_articles.sort(key=lambda a: self.calculate_topic_score(
-                        f"{a['title']} {a['description']}",
-                        user_interests,
-                        a.get('published'),
-                        corpus_texts
-                    ), reverse=True)
-                    
-                    top_articles.extend(other_articles[:more_needed])
-                    print(f"[DEBUG] Now have {len(top_articles)} articles for '{interest}'")
-
-                interest_recommendations.append(top_articles[:3])
-                print(f"[DEBUG] Added {len(top_articles[:3])} articles to recommendations for '{interest}'")
-
-            except Exception as e:
-                print(f"❌ Error forming recommendations for interest '{interest}': {e}")
-                import traceback
-                print(traceback.format_exc())
-                interest_recommendations.append([])
-
-        while len(interest_recommendations) < 3:
-            print(f"[DEBUG] Filling recommendations gap, current length: {len(interest_recommendations)}")
-            interest_recommendations.append([])
-
-        for i in range(len(interest_recommendations)):
-            while len(interest_recommendations[i]) < 3:
-                used_articles = {id(article) for group in interest_recommendations for article in group}
-                found_unused = False
-                
-                for article in all_articles:
-                    if id(article) not in used_articles:
-                        interest_recommendations[i].append(article)
-                        found_unused = True
-                        print(f"[DEBUG] Added unused article to interest group {i}")
-                        break
-                
-                if not found_unused:
-                    print("⚠️ No more unused articles to fill recommendations, duplicating top scoring...")
-                    highest_scoring = sorted(
-                        all_articles,
-                        key=lambda a: self.calculate_topic_score(
-                            f"{a['title']} {a['description']}",
-                            user_interests,
-                            a.get('published'),
-                            corpus_texts
-                        ),
-                        reverse=True
-                    )
-                    if highest_scoring:
-                        interest_recommendations[i].append(highest_scoring[0])
-                        print(f"[DEBUG] Added duplicate of top scoring article to interest group {i}")
-                    else:
-                        print(f"[ERROR] No articles available at all!")
-                        break
-
-        print("✅ Recommendation process complete.")
-        return {
-            "country_recommendations": country_recommendations[:3],
-            "interest_recommendations": [group[:3] for group in interest_recommendations[:3]]
-        }
-
+                logger.warning("Error fetching feed %s: %s", feed_urls[i], results[i])
+
+        logger.debug("Total valid articles fetched: %d", len(all_articles))
+
+        with span("score", articles=len(all_articles)):
+            corpus = self.build_corpus(all_articles, article_sources)
+
+        now = datetime.now()
+        for key in [key for key, entry in self.corpus_cache.items() if now >= entry['expiry']]:
+            del self.corpus_cache[key]
+        self.feed_parser.prune_cache()
+        self.corpus_cache[corpus_key] = {'corpus': corpus, 'expiry': now + self.result_cache_ttl}
+        return corpus
+
+    def _result_cache_key(self, feed_urls: list, user_interests: list, user_nationality: str, term_vector=None):
+        # Nationalities are keyed by the countries they resolve to, so "US" and "United States" share results
+        countries = self.feed_manager.countries.resolve_chain(user_nationality)
+        key = (tuple(user_interests), countries, frozenset(feed_urls))
+        # A personalized result is only valid for the exact vector state it was ranked with
+        return key + (term_vector.cache_key,) if term_vector is not None else key
+
+    async def get_recommendations(self, user_profile: str, feed_urls: list, user_interests: list, user_nationality: str,
+                                  term_vector=None):
+        logger.debug("Starting recommendation process")
+        logger.debug("User interests: %s", user_interests)
+        logger.debug("Feed URLs: %d total", len(feed_urls))
+        logger.debug("User nationality: %s", user_nationality)
+        logger.debug("Received feed_urls: %s...", feed_urls[:5])
+
+        cached = self._cached_result(self._result_cache_key(feed_urls, user_interests, user_nationality, term_vector))
+        if cached:
+            record_cache("result", hit=True)
+            return cached['result']
+        record_cache("result", hit=False)
+
+        results = await self.get_batch_recommendations([{
+            "interests": user_interests,
+            "nationality": user_nationality,
+            "feed_urls": feed_urls,
+            "term_vector": term_vector,
+        }])
+        return results[0]
+
+    def _cached_result(self, key) -> Optional[Dict]:
+        now = datetime.now()
+        for cache in (self.result_cache, self.warm_cache):
+            cached = cache.get(key)
+            if cached and now < cached['expiry']:
+                cache.move_to_end(key)
+                return cached
+        return None
+
+    async def get_batch_recommendations(self, profiles: List[Dict]) -> List[Dict]:
+        """Compute recommendations for many profiles against one shared corpus.
+
+        Each profile is a dict with "interests", "nationality" and optionally "feed_urls"
+        (resolved through the FeedManager when missing) and "term_vector" (a user's click
+        vector, see feedback.py, added to the scores as a rerank). The union of every profile's
+        feeds is fetched and scored once; each profile then only selects and ranks its
+        own slice. Results are returned in profile order and stored in the result cache.
+        """
+        results, _ = await self._rank_profiles(profiles, warm=False)
+        return results
+
+    async def warm_result_cache(self, profiles: List[Dict]) -> Tuple[List[Dict], int]:
+        """Precompute results for profiles and keep them for warm_cache_ttl.
+
+        A live request only hits an entry if it has the same interests (in the same order),
+        nationality, feeds and click vector state; a profile without a "term_vector" therefore
+        only serves users who have not clicked anything yet. Returns the results and the number
+        of cache entries now holding them (duplicate profiles share one).
+        """
+        results, keys = await self._rank_profiles(profiles, warm=True)
+        return results, sum(1 for key in set(keys) if key in self.warm_cache)
+
+    async def _rank_profiles(self, profiles: List[Dict], warm: bool) -> Tuple[List[Dict], List]:
+        if warm:
+            cache, ttl, max_size = self.warm_cache, self.warm_cache_ttl, self.warm_cache_size
+        else:
+            cache, ttl, max_size = self.result_cache, self.result_cache_ttl, self.result_cache_size
+
+        plans = []
+        all_feed_urls = {}
+        for profile in profiles:
+            interests = list(profile.get("interests") or [])
+            nationality = profile.get("nationality", "US")
+            feed_urls = profile.get("feed_urls") or self.feed_manager.get_feeds_for_user(interests, nationality)
+            country_feed_urls, interest_feed_urls = self.split_feeds(feed_urls, nationality)
+            plans.append((interests, nationality, feed_urls, profile.get("term_vector"),
+                          set(country_feed_urls), set(country_feed_urls + interest_feed_urls)))
+            all_feed_urls.update(dict.fromkeys(country_feed_urls + interest_feed_urls))
+
+        corpus = await self.fetch_corpus(list(all_feed_urls))
+        now = datetime.now()
+        expiry = now + ttl
+        for key in [key for key, entry in cache.items() if now >= entry['expiry']]:
+            del cache[key]
+        keys = []
+
+        options = dict(personalization_weight=self.personalization_weight,
+                       mmr_lambda=self.mmr_lambda, max_per_source=self.max_per_source)
+
+        def ranking_args(plan):
+            interests, nationality, feed_urls, term_vector, country_feeds, profile_feeds = plan
+            return (
+                # Feeds that produced no valid articles are absent from the corpus
+                np.array([corpus.feed_index[url] for url in profile_feeds if url in corpus.feed_index], dtype=np.intp),
+                np.array([corpus.feed_index[url] for url in country_feeds if url in corpus.feed_index], dtype=np.intp),
+                interests,
+                self.topic_index,
+                self.personal_terms(corpus, term_vector.as_dict()) if term_vector is not None else None,
+            )
+
+        def store(plan, ranked):
+            interests, nationality, feed_urls, term_vector = plan[:4]
+            articles = corpus.articles
+            result = {
+                "country_recommendations": [articles[row] for row in ranked["country"]],
+                "interest_recommendations": [[articles[row] for row in group] for group in ranked["interests"]],
+            }
+            key = self._result_cache_key(feed_urls, interests, nationality, term_vector)
+            cache[key] = {
+                'result': result,
+                'candidates': [articles[row] for row in ranked["remaining"]],
+                'expiry': expiry
+            }
+            cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+            keys.append(key)
+            return result
+
+        if self.scorer_pool:
+            async def rank(plan):
+                args = ranking_args(plan)
+                with span("rank"):
+                    ranked = await self.scorer_pool.rank(corpus.shared(), *args, **options)
+                return store(plan, ranked)
+
+            # Profiles are ranked in parallel across the worker processes
+            return list(await asyncio.gather(*(rank(plan) for plan in plans))), keys
+
+        # Without a pool, profiles are ranked in a worker thread a chunk at a time so a large
+        # batch never holds the event loop. Arguments are built here, where click vectors change.
+        arrays = corpus.arrays()
+
+        def rank_chunk(chunk_args):
+            return [rank_profile(arrays, *args, **options) for args in chunk_args]
+
+        results = []
+        for start in range(0, len(plans), RANK_CHUNK_SIZE):
+            chunk = plans[start:start + RANK_CHUNK_SIZE]
+            with span("rank", profiles=len(chunk)):
+                ranked = await asyncio.to_thread(rank_chunk, [ranking_args(plan) for plan in chunk])
+            results += [store(plan, chunk_ranked) for plan, chunk_ranked in zip(chunk, ranked)]
+        return results, keys
+
+    def get_candidates(self, feed_urls: list, user_interests: list, user_nationality: str,
+                       term_vector=None) -> List[Dict]:
+        """Ranked candidates left over from the last get_recommendations call for this profile."""
+        cached = self._cached_result(self._result_cache_key(feed_urls, user_interests, user_nationality, term_vector))
+        return cached['candidates'] if cached else []
 
     async def close(self):
-        await self.feed_parser.close()
\ No newline at end of file
+        if self.scorer_pool:
+            self.scorer_pool.close()
+        await self.feed_parser.close()
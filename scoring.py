@@ -0,0 +1,282 @@
+# scoring.py
+import asyncio
+import functools
+import logging
+import multiprocessing
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERESTS = ["General", "Technology", "News"]
+
+ARRAY_FIELDS = ("scores", "topic_hits", "term_rows", "term_ids", "feed_ids")
+
+# Corpora a scorer worker keeps mapped; older ones are closed as new ones arrive
+MAX_ATTACHED = 8
+
+
+class CorpusArrays:
+    """The numeric part of an ArticleCorpus: everything ranking reads, indexed by corpus row."""
+
+    def __init__(self, scores: np.ndarray, topic_hits: np.ndarray, term_rows: np.ndarray,
+                 term_ids: np.ndarray, feed_ids: np.ndarray, n_terms: int, n_feeds: int):
+        self.scores = scores            # (n,) relevance plus freshness bonus
+        self.topic_hits = topic_hits    # (n, topics) keywords of each topic found in the text
+        self.term_rows = term_rows      # sparse article x term presence, coordinate form
+        self.term_ids = term_ids
+        self.feed_ids = feed_ids        # (n,) index of each article's feed
+        self.n_terms = n_terms
+        self.n_feeds = n_feeds
+
+    def __len__(self):
+        return len(self.scores)
+
+
+def _release(shm: shared_memory.SharedMemory):
+    shm.close()
+    shm.unlink()
+
+
+class SharedCorpus:
+    """CorpusArrays copied once into a single shared memory block.
+
+    handle is a small picklable description of the block, so scorer workers map the
+    arrays by name instead of being sent a copy with every request. The block is
+    unlinked once this object is garbage collected, i.e. when the corpus it belongs to
+    has left the cache and no request is still ranking against it; workers that already
+    mapped it keep a valid mapping until they close it.
+    """
+
+    def __init__(self, arrays: CorpusArrays):
+        layout = {}
+        size = 0
+        for field in ARRAY_FIELDS:
+            array = getattr(arrays, field)
+            size = -(-size // 64) * 64  # keep every array cache-line aligned
+            layout[field] = (size, array.shape, array.dtype.str)
+            size += array.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for field, (offset, shape, dtype) in layout.items():
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = getattr(arrays, field)
+
+        self.handle = (shm.name, layout, arrays.n_terms, arrays.n_feeds)
+        self.nbytes = size
+        weakref.finalize(self, _release, shm)
+
+
+_attached = OrderedDict()
+
+
+def attach(handle) -> CorpusArrays:
+    """Map a SharedCorpus in this process as read-only arrays, reusing earlier mappings."""
+    name, layout, n_terms, n_feeds = handle
+    entry = _attached.get(name)
+    if entry is not None:
+        _attached.move_to_end(name)
+        return entry[1]
+
+    # Workers are children of the server and share its resource tracker, so attaching
+    # registers nothing new and the block is still unlinked only by the SharedCorpus
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for field, (offset, shape, dtype) in layout.items():
+        arrays[field] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        arrays[field].flags.writeable = False
+    _attached[name] = (shm, CorpusArrays(n_terms=n_terms, n_feeds=n_feeds, **arrays))
+
+    while len(_attached) > MAX_ATTACHED:
+        old_shm, old_arrays = _attached.popitem(last=False)[1]
+        del old_arrays
+        try:
+            old_shm.close()
+        except BufferError:
+            # A view escaped somewhere; leave the mapping to be reclaimed with the process
+            pass
+    return _attached[name][1]
+
+
+def assign_primary_interests(arrays: CorpusArrays, rows: np.ndarray, user_interests: list,
+                             topic_index: Dict[str, int]) -> List[str]:
+    """Pick the user interest whose keywords appear most in each article; ties go to the earlier interest."""
+    known = [interest for interest in dict.fromkeys(user_interests) if interest in topic_index]
+    if not known:
+        return [user_interests[0] if user_interests else "General"] * len(rows)
+    hits = arrays.topic_hits[np.ix_(rows, [topic_index[interest] for interest in known])]
+    return [known[j] for j in hits.argmax(axis=1)]
+
+
+def select_interests(primary: np.ndarray, scores: np.ndarray, in_country: np.ndarray,
+                     user_interests: list) -> List[str]:
+    """The three interests whose (non-country) articles score highest in total, padded
+    from the user's interests and then the defaults."""
+    names, first_seen, inverse = np.unique(primary[~in_country], return_index=True, return_inverse=True)
+    totals = np.bincount(inverse, weights=scores[~in_country], minlength=len(names))
+    # Highest total first; ties go to the interest seen first
+    top_interests = [str(names[i]) for i in np.lexsort((first_seen, -totals))[:3]]
+
+    for interest in list(user_interests) + DEFAULT_INTERESTS:
+        if len(top_interests) == 3:
+            break
+        if interest not in top_interests:
+            top_interests.append(interest)
+    return top_interests
+
+
+def select_page(arrays: CorpusArrays, rows: np.ndarray, scores: np.ndarray, in_country: np.ndarray,
+                primary_interests: List[str], user_interests: list,
+                mmr_lambda: float, max_per_source: int) -> Tuple[List[int], List[List[int]]]:
+    """Fill the country group and three interest groups in one maximal-marginal-relevance pass.
+
+    Slots are filled in page order. Each pick maximizes
+    mmr_lambda * relevance - (1 - mmr_lambda) * (max similarity to anything already picked),
+    where relevance is the score scaled to [0, 1] and similarity is the cosine overlap of
+    the articles' term sets. A group draws from its own pool first (country articles, or
+    articles whose primary interest it is) and widens to other articles when that runs
+    dry; within a pool, sources that already have max_per_source picks are passed over
+    unless nothing else is left. Each pick costs O(terms in the profile's articles), so a
+    page of k articles costs O(k * n). Returns corpus rows.
+    """
+    n = len(rows)
+    primary = np.array(primary_interests, dtype=object)
+    top_interests = select_interests(primary, scores, in_country, user_interests)
+    logger.debug("Top 3 interests selected: %s", top_interests)
+
+    # The profile's slice of the article x term matrix, as CSR over local row numbers
+    local = np.full(len(arrays), -1, dtype=np.intp)
+    local[rows] = np.arange(n)
+    in_rows = local[arrays.term_rows] >= 0
+    term_rows = local[arrays.term_rows[in_rows]]
+    term_ids = arrays.term_ids[in_rows]
+    order = np.argsort(term_rows, kind='stable')
+    sorted_term_ids = term_ids[order]
+    term_counts = np.bincount(term_rows, minlength=n)
+    indptr = np.concatenate(([0], np.cumsum(term_counts)))
+    norms = np.sqrt(np.maximum(term_counts, 1))
+
+    relevance = scores / scores.max() if n and scores.max() > 0 else np.zeros(n)
+    max_similarity = np.zeros(n)
+    selected = np.zeros(n, dtype=bool)
+    source_ids, local_sources = np.unique(arrays.feed_ids[rows], return_inverse=True)
+    source_picks = np.zeros(len(source_ids), dtype=np.intp)
+    marked = np.zeros(arrays.n_terms, dtype=bool)
+
+    def pick(pools):
+        mmr = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        under_cap = source_picks[local_sources] < max_per_source
+        for pool in pools:
+            available = pool & ~selected
+            for eligible in (available & under_cap, available):
+                if eligible.any():
+                    return int(np.argmax(np.where(eligible, mmr, -np.inf)))
+        return None
+
+    def take(i):
+        selected[i] = True
+        source_picks[local_sources[i]] += 1
+        terms = sorted_term_ids[indptr[i]:indptr[i + 1]]
+        marked[terms] = True
+        overlap = np.bincount(term_rows, weights=marked[term_ids], minlength=n)
+        marked[terms] = False
+        np.maximum(max_similarity, overlap / (norms * norms[i]), out=max_similarity)
+        return int(rows[i])
+
+    everything = np.ones(n, dtype=bool)
+    country_page = []
+    for _ in range(3):
+        i = pick([in_country, ~in_country])
+        if i is None:
+            break
+        country_page.append(take(i))
+    logger.debug("Top country recommendations: %d", len(country_page))
+
+    interest_pages = []
+    for interest in top_interests:
+        group = []
+        pools = [(primary == interest) & ~in_country, ~in_country, everything]
+        for _ in range(3):
+            i = pick(pools)
+            if i is not None:
+                group.append(take(i))
+            elif n:
+                # Fewer articles than slots: repeat the best one rather than leave a gap
+                logger.debug("No more unused articles for '%s', duplicating top scoring", interest)
+                group.append(int(rows[int(np.argmax(scores))]))
+            else:
+                logger.error("No articles available at all")
+                break
+        interest_pages.append(group)
+    return country_page, interest_pages
+
+
+def rank_profile(arrays: CorpusArrays, profile_feed_ids: np.ndarray, country_feed_ids: np.ndarray,
+                 user_interests: list, topic_index: Dict[str, int],
+                 personal: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 personalization_weight: float = 1.0, mmr_lambda: float = 0.7,
+                 max_per_source: int = 2) -> Dict:
+    """Rank one profile's slice of a corpus.
+
+    personal is the user's click vector as (term ids, weights normalized to at most 1);
+    each article gains personalization_weight times the weights of the terms it contains.
+    Returns corpus rows: the first page (country group and interest groups) and every
+    other article of the profile, best score first, for pagination.
+    """
+    scores = arrays.scores
+    if personal is not None:
+        term_ids, weights = personal
+        term_weights = np.zeros(arrays.n_terms)
+        term_weights[term_ids] = weights
+        scores = scores + personalization_weight * np.bincount(
+            arrays.term_rows, weights=term_weights[arrays.term_ids], minlength=len(arrays)
+        )
+
+    in_profile = np.zeros(arrays.n_feeds, dtype=bool)
+    in_profile[profile_feed_ids] = True
+    is_country = np.zeros(arrays.n_feeds, dtype=bool)
+    is_country[country_feed_ids] = True
+
+    rows = np.flatnonzero(in_profile[arrays.feed_ids])
+    in_country = is_country[arrays.feed_ids[rows]]
+    primary_interests = assign_primary_interests(arrays, rows, user_interests, topic_index)
+
+    country_page, interest_pages = select_page(
+        arrays, rows, scores[rows], in_country, primary_interests, user_interests, mmr_lambda, max_per_source
+    )
+
+    shown = np.array(country_page + [row for group in interest_pages for row in group], dtype=np.intp)
+    order = rows[np.argsort(-scores[rows], kind='stable')]
+    return {
+        "country": country_page,
+        "interests": interest_pages,
+        "remaining": order[~np.isin(order, shown)],
+    }
+
+
+def rank_shared(handle, *args, **kwargs) -> Dict:
+    return rank_profile(attach(handle), *args, **kwargs)
+
+
+class ScorerPool:
+    """Worker processes that rank profiles against SharedCorpus blocks.
+
+    Ranking is CPU-bound numpy and Python; running it here keeps the event loop free and
+    lets concurrent requests (and batch profiles) use every core. Workers are spawned,
+    not forked, so they never inherit the server's threads or sockets.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+    async def rank(self, shared: SharedCorpus, *args, **kwargs) -> Dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(rank_shared, shared.handle, *args, **kwargs))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,141 @@
+# serialization.py
+import gzip
+import json
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from fastapi.responses import Response
+
+from metrics import record_cache
+
+try:
+    import orjson
+
+    def dumps(value) -> bytes:
+        return orjson.dumps(value)
+except ImportError:
+    # Same output, several times slower on thumbnail-heavy payloads
+    orjson = None
+
+    def dumps(value) -> bytes:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The exact shape of an article in API responses, in output order
+ARTICLE_FIELDS = ('title', 'description', 'link', 'published', 'thumbnail', 'author', 'categories')
+
+# Bodies smaller than this are not worth the compression CPU
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def article_payload(article: Dict) -> Dict:
+    """Reduce a parsed article to plain JSON types.
+
+    feedparser hands back its tags as FeedParserDicts; only term, scheme and label are kept.
+    """
+    payload = {field: article.get(field) for field in ARTICLE_FIELDS}
+    payload['categories'] = [
+        {'term': tag.get('term'), 'scheme': tag.get('scheme'), 'label': tag.get('label')}
+        for tag in (article.get('categories') or [])
+    ]
+    return payload
+
+
+class FragmentCache:
+    """LRU of encoded article JSON, so an article is serialized once however many responses include it.
+
+    Keyed by id() of the article dict; each entry keeps a reference to its article so the
+    id cannot be recycled while the entry is alive, and a hit is only trusted if it is
+    the very same object. Bounded by the total size of the fragments, since an article with
+    an inlined thumbnail encodes to tens of KB; discard() releases the articles of feeds
+    that left the feed cache.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, article: Dict) -> bytes:
+        key = id(article)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is article:
+            self._entries.move_to_end(key)
+            record_cache("fragment", hit=True)
+            return entry[1]
+
+        record_cache("fragment", hit=False)
+        fragment = dumps(article_payload(article))
+        if entry is not None:
+            self.size -= len(entry[1])
+        self._entries[key] = (article, fragment)
+        self._entries.move_to_end(key)
+        self.size += len(fragment)
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+        return fragment
+
+    def discard(self, articles: List[Dict]):
+        for article in articles:
+            entry = self._entries.get(id(article))
+            if entry is not None and entry[0] is article:
+                del self._entries[id(article)]
+                self.size -= len(entry[1])
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+fragment_cache = FragmentCache()
+
+
+def encode_recommendations(articles: List[Dict], extra: Dict) -> bytes:
+    """Build the response body from cached article fragments plus the small per-user fields."""
+    body = bytearray(b'{"recommendations":[')
+    body += b','.join(fragment_cache.get(article) for article in articles)
+    body += b']'
+    for key, value in extra.items():
+        body += b',' + dumps(key) + b':' + dumps(value)
+    body += b'}'
+    return bytes(body)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0 exclusions."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in (('br',) if brotli else ()) + ('gzip',):
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def json_response(body: bytes, accept_encoding: Optional[str] = None) -> Response:
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding == 'br':
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+        headers['Content-Encoding'] = 'br'
+    elif encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(content=body, media_type='application/json', headers=headers)